@@ -0,0 +1,276 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from rest_framework.views import APIView
+
+from recipes.cache import get_recipe_cache_stats
+from recipes.permissions import IsAdmin
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+HISTOGRAMS = {
+    "request_duration_seconds": (
+        "Time to answer a request.",
+        DURATION_BUCKETS,
+    ),
+    "request_db_duration_seconds": (
+        "Time spent in database queries by a request.",
+        DURATION_BUCKETS,
+    ),
+    "request_render_duration_seconds": (
+        "Time spent rendering the API response.",
+        DURATION_BUCKETS,
+    ),
+    "request_queries": ("Database queries run by a request.", QUERIES_BUCKETS),
+    "response_size_bytes": (
+        "Size of the response body, streamed ones excluded.",
+        SIZE_BUCKETS,
+    ),
+}
+PREFIX = "foodgram_"
+
+
+class Histogram:
+    """Counts of observed values by bucket upper bound, as in Prometheus."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, count of values up to it) pairs, +Inf last."""
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            yield bound, total
+
+
+def _labels(**labels):
+    return ",".join(
+        '{}="{}"'.format(
+            name, str(value).replace("\\", "\\\\").replace('"', '\\"')
+        )
+        for name, value in labels.items()
+    )
+
+
+class MetricsRegistry:
+    """Request metrics of this process by route and method."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {name: {} for name in HISTOGRAMS}
+        self.requests = {}
+
+    def record(self, route, method, status, metrics):
+        key = (route, method)
+        with self.lock:
+            status_key = (route, method, status)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            for name, value in (
+                ("request_duration_seconds", metrics.duration),
+                ("request_db_duration_seconds", metrics.db_duration),
+                ("request_render_duration_seconds", metrics.render_duration),
+                ("request_queries", metrics.queries),
+                ("response_size_bytes", metrics.size),
+            ):
+                if value is None:
+                    continue
+                histograms = self.histograms[name]
+                if key not in histograms:
+                    histograms[key] = Histogram(HISTOGRAMS[name][1])
+                histograms[key].observe(value)
+
+    def export(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {PREFIX}requests_total Answered requests.",
+            f"# TYPE {PREFIX}requests_total counter",
+        ]
+        with self.lock:
+            for (route, method, status), count in sorted(
+                self.requests.items()
+            ):
+                labels = _labels(route=route, method=method, status=status)
+                lines.append(f"{PREFIX}requests_total{{{labels}}} {count}")
+            for name, (description, _) in HISTOGRAMS.items():
+                lines.append(f"# HELP {PREFIX}{name} {description}")
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for (route, method), histogram in sorted(
+                    self.histograms[name].items()
+                ):
+                    labels = _labels(route=route, method=method)
+                    for bound, count in histogram.cumulative():
+                        lines.append(
+                            f"{PREFIX}{name}_bucket"
+                            f'{{{labels},le="{bound}"}} {count}'
+                        )
+                    lines.append(
+                        f"{PREFIX}{name}_sum{{{labels}}} {histogram.sum}"
+                    )
+                    lines.append(
+                        f"{PREFIX}{name}_count{{{labels}}} {histogram.count}"
+                    )
+        hits, misses = get_recipe_cache_stats()
+        lines += [
+            f"# HELP {PREFIX}recipe_cache_requests_total Recipe "
+            "representations looked up in the cache.",
+            f"# TYPE {PREFIX}recipe_cache_requests_total counter",
+            f'{PREFIX}recipe_cache_requests_total{{result="hit"}} {hits}',
+            f'{PREFIX}recipe_cache_requests_total{{result="miss"}} {misses}',
+        ]
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """What a request cost, collected while it is answered."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = None
+        self.queries = 0
+        self.db_duration = 0
+        self.render_duration = 0
+        self.size = None
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper timing every query."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_duration += time.perf_counter() - started
+            self.queries += 1
+
+    @property
+    def app_duration(self):
+        """Time in the views and serializers, without queries and render."""
+        return max(self.duration - self.db_duration - self.render_duration, 0)
+
+    def server_timing(self):
+        return ", ".join(
+            (
+                f"db;dur={self.db_duration * 1000:.1f};"
+                f'desc="{self.queries} queries"',
+                f"app;dur={self.app_duration * 1000:.1f}",
+                f"render;dur={self.render_duration * 1000:.1f}",
+                f"total;dur={self.duration * 1000:.1f}",
+            )
+        )
+
+
+class MeasuredStream:
+    """Streamed content whose queries are still counted for the request.
+
+    A streaming response runs its body only once it is sent, ``done`` is
+    called when the content is used up or closed.
+    """
+
+    def __init__(self, content, metrics, done):
+        self.content = iter(content)
+        self.metrics = metrics
+        self.done = done
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with connection.execute_wrapper(self.metrics):
+            try:
+                return next(self.content)
+            except StopIteration:
+                self.close()
+                raise
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.done()
+
+
+class PerformanceMiddleware:
+    """Measures every request, reports it and adds it to the histograms.
+
+    The timings are sent in the ``Server-Timing`` header when
+    ``SERVER_TIMING`` is on and logged as a JSON line by this module's
+    logger. Histograms are kept per process, see ``MetricsView``.
+    Streamed responses are reported once their body is sent, they have
+    no header: it goes out before the body is made.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = request.metrics = RequestMetrics()
+        with connection.execute_wrapper(metrics):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = MeasuredStream(
+                response.streaming_content,
+                metrics,
+                lambda: self.report(request, response, metrics),
+            )
+            return response
+        metrics.size = len(response.content)
+        self.report(request, response, metrics)
+        if settings.SERVER_TIMING:
+            response["Server-Timing"] = metrics.server_timing()
+        return response
+
+    def report(self, request, response, metrics):
+        metrics.duration = time.perf_counter() - metrics.started
+        match = request.resolver_match
+        route = match.view_name if match else "unmatched"
+        registry.record(route, request.method, response.status_code, metrics)
+        logger.info(
+            json.dumps(
+                {
+                    "method": request.method,
+                    "path": request.path,
+                    "route": route,
+                    "status": response.status_code,
+                    "duration_ms": round(metrics.duration * 1000, 2),
+                    "app_ms": round(metrics.app_duration * 1000, 2),
+                    "db_ms": round(metrics.db_duration * 1000, 2),
+                    "render_ms": round(metrics.render_duration * 1000, 2),
+                    "queries": metrics.queries,
+                    "bytes": metrics.size,
+                }
+            )
+        )
+
+
+class MetricsView(APIView):
+    """Request histograms of this process in the Prometheus text format.
+
+    Every gunicorn worker keeps its own, scrape them one by one or run a
+    single worker.
+    """
+
+    permission_classes = (IsAdmin,)
+
+    def get(self, request):
+        return HttpResponse(
+            registry.export(), content_type="text/plain; version=0.0.4"
+        )
@@ -1,7 +1,129 @@
+import base64
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class LimitPageNumberPaginator(PageNumberPagination):
     """Пагинация с перееопределением названия поля."""
 
     page_size_query_param = "limit"
+    max_page_size = settings.PAGINATION_MAX_PAGE_SIZE
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that estimates the count of an unfiltered table.
+
+    On PostgreSQL the planner statistics are used instead of ``COUNT(*)``
+    when ``PAGINATION_ESTIMATED_COUNT`` is on and nothing is filtered.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, "query", None)
+        if (
+            settings.PAGINATION_ESTIMATED_COUNT
+            and connection.vendor == "postgresql"
+            and query is not None
+            and not query.where
+        ):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE relname = %s",
+                    [self.object_list.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row is not None and row[0] >= 0:
+                return int(row[0])
+        return super().count
+
+
+class RecipePagination(LimitPageNumberPaginator):
+    """Recipe feed pagination.
+
+    Pages are numbered as usual, passing ``cursor`` (empty for the first
+    page) switches to keyset pagination over the ordering of the queryset,
+    ``(pub_date, id)`` unless it is sorted by a score: every page costs
+    the same however deep it is, and there is no count.
+    """
+
+    django_paginator_class = EstimatedCountPaginator
+    cursor_query_param = "cursor"
+    ordering = ("-pub_date", "-id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        limit = self.get_page_size(request)
+        ordering = tuple(queryset.query.order_by) or self.ordering
+        field = queryset.model._meta.get_field(ordering[0].lstrip("-"))
+        position = self.decode_cursor(
+            request.query_params[self.cursor_query_param], field
+        )
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            value, pk = position
+            queryset = queryset.filter(
+                Q(**{f"{field.name}__lt": value})
+                | Q(**{field.name: value, "pk__lt": pk})
+            )
+        recipes = list(queryset[: limit + 1])
+        self.next_position = None
+        if len(recipes) > limit:
+            recipes = recipes[:limit]
+            self.next_position = (
+                getattr(recipes[-1], field.name),
+                recipes[-1].pk,
+            )
+        return recipes
+
+    def decode_cursor(self, cursor, field):
+        if not cursor:
+            return None
+        try:
+            value, pk = (
+                base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            )
+            return field.to_python(value), int(pk)
+        except (ValueError, UnicodeDecodeError, ValidationError):
+            raise NotFound("Неверный курсор")
+
+    @staticmethod
+    def encode_cursor(position):
+        value, pk = position
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        return base64.urlsafe_b64encode(f"{value}|{pk}".encode()).decode()
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(
+            OrderedDict([("next", self.get_next_link()), ("results", data)])
+        )
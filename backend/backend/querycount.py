@@ -0,0 +1,67 @@
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+SIZES = (1, 10, 50)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """More queries than allowed, or their number grows with the data."""
+
+
+def _format_queries(context):
+    return "\n".join(
+        f"{number}. {query['sql']}"
+        for number, query in enumerate(context.captured_queries, 1)
+    )
+
+
+@contextmanager
+def query_budget(limit, using=DEFAULT_DB_ALIAS):
+    """Fail if the block runs more than limit queries.
+
+    Works as a decorator too::
+
+        @query_budget(3)
+        def test_recipe_list(self):
+            ...
+    """
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+    if len(context) > limit:
+        raise QueryBudgetExceeded(
+            f"{len(context)} queries, the budget is {limit}:\n"
+            + _format_queries(context)
+        )
+
+
+def assert_constant_queries(
+    func, sizes=SIZES, limit=None, setup=None, using=DEFAULT_DB_ALIAS
+):
+    """Call func(size) for each size, fail if the query count grows.
+
+    func makes the request whose results have ``size`` items: a page of
+    that many rows, a cart of that many recipes... The count must not
+    depend on the size, and must stay within limit if there is one.
+    setup(size), if given, prepares the data and is not counted.
+    Returns the number of queries by size.
+    """
+    counts = {}
+    for size in sizes:
+        if setup is not None:
+            setup(size)
+        with CaptureQueriesContext(connections[using]) as context:
+            func(size)
+        counts[size] = len(context)
+        if len(context) > counts[sizes[0]]:
+            raise QueryBudgetExceeded(
+                f"{counts} queries by size, they grow with it, at "
+                f"{size}:\n{_format_queries(context)}"
+            )
+        if limit is not None and len(context) > limit:
+            raise QueryBudgetExceeded(
+                f"{len(context)} queries at size {size}, the budget is "
+                f"{limit}:\n{_format_queries(context)}"
+            )
+    return counts
@@ -0,0 +1,17 @@
+import time
+
+from rest_framework.renderers import JSONRenderer
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSON renderer adding its time to the metrics of the request."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            request = (renderer_context or {}).get("request")
+            metrics = getattr(request, "metrics", None)
+            if metrics is not None:
+                metrics.render_duration += time.perf_counter() - started
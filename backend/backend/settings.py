@@ -32,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.metrics.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,6 +75,23 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+# Cached API responses: how long they are kept and how long clients may
+# reuse them without revalidating. The default cache lives in each process,
+# so changes made by another one (a worker, a management command) show up
+# once the entries expire; a shared CACHE_BACKEND can keep them longer.
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', default=5 * 60))
+API_CACHE_MAX_AGE = 60
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -117,10 +135,25 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    'DEFAULT_RENDERER_CLASSES': (
+        'backend.renderers.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     "PAGE_SIZE": 6,
 }
 
+# The most items a page may hold whatever ``?limit=`` asks for.
+PAGINATION_MAX_PAGE_SIZE = int(
+    os.getenv('PAGINATION_MAX_PAGE_SIZE', default=50)
+)
+
+# Estimate the count of unfiltered recipe pages from the PostgreSQL planner
+# statistics instead of running COUNT(*).
+PAGINATION_ESTIMATED_COUNT = (
+    os.getenv('PAGINATION_ESTIMATED_COUNT', default='False') == 'True'
+)
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -138,4 +171,50 @@ DJOSER = {
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-DOWNLOADING_CART_NAME = 'shopping-list.txt'
+DOWNLOADING_CART_NAME = 'shopping-list'
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+# Serve ingredient search from an in-memory index instead of the database.
+INGREDIENT_SEARCH_INDEX = (
+    os.getenv('INGREDIENT_SEARCH_INDEX', default='False') == 'True'
+)
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+
+# Each favorite and cart addition counts half as much in the trending score
+# of a recipe every this many seconds.
+RECIPE_TRENDING_HALF_LIFE = 60 * 60 * 24 * 7
+
+# Threads of each process that resize recipe photos, 0 leaves them to
+# `manage.py process_recipe_images --watch`.
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+
+# Limits of an uploaded recipe photo, checked while it is being received.
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_SIDE = 8000
+
+# Send the time spent in the database, views and rendering of every
+# request in the Server-Timing header. Off by default: the timings tell
+# clients about the internals, turn it on while profiling.
+SERVER_TIMING = os.getenv('SERVER_TIMING', default='False') == 'True'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # One JSON line per request, at INFO: REQUEST_LOG_LEVEL=INFO logs
+        # them.
+        'backend.metrics': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_LOG_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
+    },
+}
@@ -3,8 +3,11 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from backend.metrics import MetricsView
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("api/metrics/", MetricsView.as_view(), name="metrics"),
     path("api/", include("recipes.urls")),
     path("api/", include("users.urls")),
     path("api/", include("tags.urls")),
@@ -37,16 +37,22 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "author", "amount_favorites")
+    list_display = (
+        "id",
+        "name",
+        "author",
+        "amount_favorites",
+        "in_carts_count",
+    )
     list_filter = ("name", "author", "tags")
     search_fields = ("name",)
     inlines = (RecipeIngredientInline,)
     empty_value_display = "-пусто-"
 
     @staticmethod
-    @admin.display(description="В избранном, раз")
+    @admin.display(description="В избранном, раз", ordering="favorites_count")
     def amount_favorites(obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
 @admin.register(FavoriteRecipe)
@@ -0,0 +1,170 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+
+def _version_key(namespace):
+    return f"api:{namespace}:version"
+
+
+def get_cache_version(namespace):
+    """The current version of the cached data in the namespace.
+
+    A missing version starts from the current time in milliseconds, so a
+    version evicted from the cache never reuses the number of older entries.
+    """
+    version = cache.get(_version_key(namespace))
+    if version is not None:
+        return version
+    cache.add(_version_key(namespace), int(time.time() * 1000), None)
+    return cache.get(_version_key(namespace))
+
+
+def bump_cache_version(namespace):
+    """Invalidate every cached response of the namespace."""
+    try:
+        cache.incr(_version_key(namespace))
+    except ValueError:
+        get_cache_version(namespace)
+
+
+def is_cache_shared():
+    """Whether the processes of the server share the cache."""
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+
+def bump_shared_cache_versions(*namespaces):
+    """Invalidate the namespaces from outside the server, e.g. a command.
+
+    Bumps nothing and returns False when every process has a cache of its
+    own: the server then only sees the change once its entries expire.
+    """
+    if not is_cache_shared():
+        return False
+    for namespace in namespaces:
+        bump_cache_version(namespace)
+    return True
+
+
+def get_local_cache_notice():
+    """What to tell after a change the server's cache cannot be told of."""
+    return (
+        "the server keeps its own cache in each process, its responses "
+        f"catch up within {settings.API_CACHE_TIMEOUT} s, restart it to "
+        "see the changes now"
+    )
+
+
+def cache_response(namespace):
+    """Serve the JSON of a view method from the cache.
+
+    The rendered bytes are stored under the namespace version and the full
+    path, and sent with an ETag so that clients and proxies can revalidate
+    without the view running at all.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if request.accepted_renderer.format != "json":
+                return method(view, request, *args, **kwargs)
+            version = get_cache_version(namespace)
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = f"api:{namespace}:{version}:{path}"
+            etag = f'"{namespace}-{version}-{path}"'
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                content = cache.get(key)
+                if content is None:
+                    response = method(view, request, *args, **kwargs)
+                    if response.status_code != status.HTTP_200_OK:
+                        return response
+                    content = JSONRenderer().render(response.data)
+                    cache.set(key, content, settings.API_CACHE_TIMEOUT)
+                response = HttpResponse(
+                    content, content_type="application/json"
+                )
+            response["ETag"] = etag
+            patch_cache_control(
+                response, public=True, max_age=settings.API_CACHE_MAX_AGE
+            )
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _recipe_key(pk):
+    return f"api:recipe:{pk}"
+
+
+def _count(name, value):
+    if not value:
+        return
+    key = f"api:recipe:stats:{name}"
+    try:
+        cache.incr(key, value)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key, value)
+
+
+def get_recipe_stamp(request):
+    """What the cached representations of recipes depend on besides them.
+
+    Tags and ingredients are versioned as a whole, and image URLs are
+    absolute, so they depend on the host of the request.
+    """
+    return (
+        get_cache_version("tags"),
+        get_cache_version("ingredients"),
+        request.build_absolute_uri("/") if request else None,
+    )
+
+
+def get_recipe_fragments(pks, stamp):
+    """Cached user-independent representations of the recipes by pk."""
+    cached = cache.get_many([_recipe_key(pk) for pk in pks])
+    fragments = {}
+    for pk in pks:
+        entry = cached.get(_recipe_key(pk))
+        if entry is not None and entry[0] == stamp:
+            fragments[pk] = entry[1]
+    _count("hits", len(fragments))
+    _count("misses", len(pks) - len(fragments))
+    return fragments
+
+
+def set_recipe_fragments(fragments, stamp):
+    cache.set_many(
+        {
+            _recipe_key(pk): (stamp, fragment)
+            for pk, fragment in fragments.items()
+        },
+        settings.API_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_recipe_fragments(pks):
+    cache.delete_many([_recipe_key(pk) for pk in pks])
+
+
+def get_recipe_cache_stats():
+    """Hits and misses of the recipe representation cache."""
+    stats = cache.get_many(
+        ["api:recipe:stats:hits", "api:recipe:stats:misses"]
+    )
+    return (
+        stats.get("api:recipe:stats:hits", 0),
+        stats.get("api:recipe:stats:misses", 0),
+    )
@@ -0,0 +1,212 @@
+import json
+from collections import Counter, defaultdict
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.serializers.python import Deserializer
+from django.db import connection, models, transaction
+
+from .importers import iter_json_array
+
+
+def sort_models(model_list):
+    """Order the models so that each comes after the models it references."""
+    ordered = []
+    visiting = set()
+
+    def visit(model):
+        if model in ordered or model in visiting:
+            return
+        visiting.add(model)
+        for field in model._meta.local_fields:
+            if field.is_relation and field.related_model not in (None, model):
+                visit(field.related_model._meta.concrete_model)
+        ordered.append(model)
+
+    for model in model_list:
+        visit(model)
+    return [model for model in ordered if model in model_list]
+
+
+def _matches(model, labels):
+    return (
+        model._meta.app_label in labels
+        or model._meta.label_lower in labels
+    )
+
+
+def get_dump_models(labels=(), exclude=()):
+    """The models of the apps or models in labels, all of them by default."""
+    labels = {label.lower() for label in labels}
+    exclude = {label.lower() for label in exclude}
+    return sort_models(
+        [
+            model
+            for model in apps.get_models()
+            if model._meta.managed
+            and not model._meta.proxy
+            and (not labels or _matches(model, labels))
+            and not _matches(model, exclude)
+        ]
+    )
+
+
+def _m2m_fields(model):
+    """Many-to-many fields stored in the fixture of the model."""
+    return [
+        field
+        for field in model._meta.local_many_to_many
+        if field.serialize and field.remote_field.through._meta.auto_created
+    ]
+
+
+def dump_fixture(file, model_list, batch_size=1000):
+    """Write the rows of the models as a fixture ``loaddata`` can read.
+
+    Rows are read in batches by primary key, with their many-to-many
+    values prefetched, and written one object per line. The models should
+    come in dependency order, see ``sort_models``. Returns the numbers of
+    written objects by model label.
+    """
+    serializer = serializers.get_serializer("python")()
+    counts = Counter()
+    separator = "[\n"
+    for model in model_list:
+        queryset = model._base_manager.order_by("pk").prefetch_related(
+            *(
+                models.Prefetch(
+                    field.name,
+                    queryset=field.related_model._base_manager.only("pk"),
+                )
+                for field in _m2m_fields(model)
+            )
+        )
+        last_pk = None
+        while True:
+            batch = queryset
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            for item in serializer.serialize(batch):
+                file.write(separator)
+                json.dump(
+                    item, file, cls=DjangoJSONEncoder, ensure_ascii=False
+                )
+                separator = ",\n"
+            counts[model._meta.label] += len(batch)
+            last_pk = batch[-1].pk
+    file.write("[]\n" if separator == "[\n" else "\n]\n")
+    return counts
+
+
+class FixtureLoader:
+    """Loads fixtures with bulk inserts instead of saving objects one by one.
+
+    Objects are queued by model and inserted in batches, a full batch
+    flushing the queues of the models it may reference first. Like
+    ``loaddata`` no signals are sent and fields such as ``auto_now_add``
+    keep the values of the fixture. Rows with existing primary keys fail
+    unless ``ignore_conflicts`` is set, they are never updated.
+    """
+
+    def __init__(self, batch_size=1000, exclude=(), ignore_conflicts=False):
+        self.batch_size = batch_size
+        self.exclude = {label.lower() for label in exclude}
+        self.ignore_conflicts = ignore_conflicts
+        self.models = sort_models(
+            [
+                model
+                for model in apps.get_models(include_auto_created=True)
+                if not model._meta.proxy
+            ]
+        )
+        self.order = {model: index for index, model in enumerate(self.models)}
+        self.pending = defaultdict(list)
+        self.counts = Counter()
+
+    def load(self, file):
+        """Load the fixture file, return the numbers of rows by model."""
+        items = (
+            item
+            for item in iter_json_array(file)
+            if item["model"].lower() not in self.exclude
+            and item["model"].lower().split(".")[0] not in self.exclude
+        )
+        with transaction.atomic():
+            with connection.constraint_checks_disabled():
+                for deserialized in Deserializer(
+                    items, handle_forward_references=False
+                ):
+                    self.add(deserialized)
+                self.flush()
+            loaded = [
+                model
+                for model in self.models
+                if model._meta.label in self.counts
+            ]
+            connection.check_constraints(
+                table_names=[model._meta.db_table for model in loaded]
+            )
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                    no_style(), loaded
+                ):
+                    cursor.execute(sql)
+        return self.counts
+
+    def add(self, deserialized):
+        obj = deserialized.object
+        model = obj._meta.concrete_model
+        self.queue(model, obj)
+        for name, pks in deserialized.m2m_data.items():
+            field = model._meta.get_field(name)
+            through = field.remote_field.through
+            if not through._meta.auto_created:
+                continue
+            source = through._meta.get_field(field.m2m_field_name()).attname
+            target = through._meta.get_field(
+                field.m2m_reverse_field_name()
+            ).attname
+            for pk in pks:
+                self.queue(through, through(**{source: obj.pk, target: pk}))
+
+    def queue(self, model, obj):
+        self.pending[model].append(obj)
+        if len(self.pending[model]) >= self.batch_size:
+            self.flush(self.order[model])
+
+    def flush(self, last=None):
+        """Insert the queued objects of the models up to the given one."""
+        for model in self.models:
+            if last is not None and self.order[model] > last:
+                break
+            objs = self.pending.pop(model, None)
+            if objs:
+                self.insert(model, objs)
+
+    def insert(self, model, objs):
+        queryset = model._base_manager.using(connection.alias)
+        for with_pk in (True, False):
+            group = [obj for obj in objs if (obj.pk is not None) == with_pk]
+            if not group:
+                continue
+            fields = [
+                field
+                for field in model._meta.local_concrete_fields
+                if with_pk or not field.primary_key
+            ]
+            size = connection.ops.bulk_batch_size(fields, group) or len(group)
+            for start in range(0, len(group), size):
+                # raw keeps pre_save, e.g. auto_now_add, from overwriting
+                # the values of the fixture, as Model.save_base(raw=True).
+                queryset._insert(
+                    group[start:start + size],
+                    fields=fields,
+                    raw=True,
+                    ignore_conflicts=self.ignore_conflicts,
+                )
+        self.counts[model._meta.label] += len(objs)
@@ -0,0 +1,212 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import connection
+from django.db.models import F
+from django.template.defaultfilters import filesizeformat
+from django.utils.encoding import filepath_to_uri
+from PIL import Image, ImageOps
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from .cache import invalidate_recipe_fragments
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# The longest side of every variant, images are never enlarged.
+IMAGE_VARIANTS = {"thumbnail": 320, "medium": 800, "full": 1600}
+IMAGE_FORMATS = {
+    "jpeg": ("JPEG", "jpg", {"quality": 85, "optimize": True}),
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+}
+VARIANTS_PATH = "recipes/variants"
+# Bytes of an upload to look for the image header in.
+HEADER_LIMIT = 256 * 1024
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def get_media_url(request=None):
+    """URL prefix of the stored photos, absolute when there is a request."""
+    base_url = Recipe._meta.get_field("image").storage.base_url
+    return request.build_absolute_uri(base_url) if request else base_url
+
+
+def image_url(name, media_url):
+    """URL of a stored photo built from its name without the storage."""
+    return media_url + filepath_to_uri(name)
+
+
+def get_variant_name(recipe, variant, image_format="jpeg"):
+    """File name of the variant, the original image while it is not made."""
+    return (
+        recipe.image_variants.get(variant, {}).get(image_format)
+        or recipe.image.name
+    )
+
+
+class RecipeImageField(serializers.Field):
+    """Read-only URL of a variant of the recipe image."""
+
+    def __init__(self, variant, **kwargs):
+        self.variant = variant
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        return image_url(
+            get_variant_name(recipe, self.variant),
+            get_media_url(self.context.get("request")),
+        )
+
+
+def check_image_dimensions(width, height):
+    """Reject a photo larger than ``RECIPE_IMAGE_MAX_SIDE`` on a side."""
+    if max(width, height) > settings.RECIPE_IMAGE_MAX_SIDE:
+        raise ValidationError(
+            f"Фото больше {settings.RECIPE_IMAGE_MAX_SIDE} точек по стороне"
+        )
+
+
+class RecipeImageUploadHandler(TemporaryFileUploadHandler):
+    """Streams uploaded photos to temporary files, checking them on the way.
+
+    The upload stops as soon as it exceeds ``RECIPE_IMAGE_MAX_SIZE`` or its
+    header declares a photo too large, the pixels are never decoded here.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.header = b""
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ValidationError(
+                {
+                    self.field_name: [
+                        "Фото больше "
+                        + filesizeformat(settings.RECIPE_IMAGE_MAX_SIZE)
+                    ]
+                }
+            )
+        if self.header is not None:
+            self.check_header(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_header(self, raw_data):
+        self.header += raw_data
+        try:
+            width, height = Image.open(io.BytesIO(self.header)).size
+        except Image.DecompressionBombError:
+            width = height = settings.RECIPE_IMAGE_MAX_SIDE + 1
+        except OSError:
+            # Not enough data yet, or not an image: that is left to the
+            # serializer.
+            if len(self.header) > HEADER_LIMIT:
+                self.header = None
+            return
+        self.header = None
+        try:
+            check_image_dimensions(width, height)
+        except ValidationError as error:
+            raise ValidationError({self.field_name: error.detail})
+
+
+def _save_variant(image, variant, image_format):
+    """Encode and store the variant under a name made of its hash."""
+    pil_format, extension, options = IMAGE_FORMATS[image_format]
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    content = buffer.getvalue()
+    digest = hashlib.sha256(content).hexdigest()[:20]
+    name = f"{VARIANTS_PATH}/{digest}-{variant}.{extension}"
+    storage = Recipe._meta.get_field("image").storage
+    if not storage.exists(name):
+        storage.save(name, ContentFile(content))
+    return name
+
+
+def make_image_variants(recipe):
+    """Resize the recipe image into every variant and format."""
+    with recipe.image.open("rb") as file:
+        image = ImageOps.exif_transpose(Image.open(file)).convert("RGB")
+    variants = {}
+    for variant, size in IMAGE_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        variants[variant] = {
+            image_format: _save_variant(resized, variant, image_format)
+            for image_format in IMAGE_FORMATS
+        }
+    return variants
+
+
+def get_pending_recipes():
+    """Recipes whose image variants are missing or made from another image."""
+    return (
+        Recipe.objects.exclude(image="")
+        .exclude(image_variants_source=F("image"))
+        .only("image", "image_variants", "image_variants_source")
+    )
+
+
+def process_recipe_image(pk):
+    """Make the variants of the recipe image unless they are up to date.
+
+    An image that cannot be read is marked as processed without variants,
+    the original is served then. Returns whether the recipe was updated.
+    """
+    recipe = get_pending_recipes().filter(pk=pk).first()
+    if recipe is None:
+        return False
+    source = recipe.image.name
+    try:
+        variants = make_image_variants(recipe)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.exception("Cannot make variants of recipe image %s", source)
+        variants = {}
+    updated = Recipe.objects.filter(pk=pk, image=source).update(
+        image_variants=variants, image_variants_source=source
+    )
+    if updated:
+        invalidate_recipe_fragments([pk])
+    return bool(updated)
+
+
+def _process_in_background(pk):
+    try:
+        process_recipe_image(pk)
+    except Exception:
+        logger.exception("Cannot process the image of recipe %s", pk)
+    finally:
+        connection.close()
+
+
+def schedule_recipe_image(pk):
+    """Process the recipe image in a background thread of this process.
+
+    With ``RECIPE_IMAGE_WORKERS = 0`` nothing runs here and the images wait
+    for ``manage.py process_recipe_images --watch``.
+    """
+    if not settings.RECIPE_IMAGE_WORKERS:
+        return
+    with _executor_lock:
+        if "images" not in _executors:
+            _executors["images"] = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix="recipe-images",
+            )
+    _executors["images"].submit(_process_in_background, pk)
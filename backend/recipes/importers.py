@@ -0,0 +1,217 @@
+import csv
+import itertools
+import json
+
+from django.db import connection, transaction
+
+from tags.models import Tag
+
+from .models import Ingredient
+
+JSON_CHUNK_SIZE = 64 * 1024
+INGREDIENT_FIELDS = ("name", "measurement_unit")
+TAG_FIELDS = ("name", "color", "slug")
+NUMBER_CHARS = "0123456789.eE+-"
+
+
+class _JsonArrayReader:
+    """Decodes the items of a JSON array from a file read in chunks."""
+
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def read_more(self):
+        chunk = self.file.read(self.chunk_size)
+        self.eof = not chunk
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+
+    def next_char(self):
+        """The next character that is not whitespace, "" at the end."""
+        while True:
+            while (
+                self.position < len(self.buffer)
+                and self.buffer[self.position].isspace()
+            ):
+                self.position += 1
+            if self.position < len(self.buffer) or self.eof:
+                return self.buffer[self.position:self.position + 1]
+            self.read_more()
+
+    def expect(self, chars):
+        char = self.next_char()
+        if not char or char not in chars:
+            raise ValueError(
+                f"expected {' or '.join(chars)!r}, got {char or 'EOF'!r}"
+            )
+        self.position += 1
+        return char
+
+    def decode(self):
+        self.next_char()
+        while True:
+            try:
+                item, end = self.decoder.raw_decode(
+                    self.buffer, self.position
+                )
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            else:
+                # A number may go on in the next chunk.
+                if self.eof or (
+                    end < len(self.buffer)
+                    and self.buffer[end] not in NUMBER_CHARS
+                ):
+                    self.position = end
+                    return item
+            self.read_more()
+
+    def __iter__(self):
+        self.expect("[")
+        if self.next_char() == "]":
+            return
+        while True:
+            yield self.decode()
+            if self.expect(",]") == "]":
+                return
+
+
+def iter_json_array(file, chunk_size=JSON_CHUNK_SIZE):
+    """Yield the items of the JSON array in the file one by one.
+
+    The file is read in chunks, only the item being decoded is kept in
+    memory.
+    """
+    return iter(_JsonArrayReader(file, chunk_size))
+
+
+def iter_csv_rows(file, fields, header=False):
+    """Yield the rows of the csv file as dicts with the given fields."""
+    reader = csv.reader(file)
+    if header:
+        next(reader, None)
+    for row in reader:
+        if any(row):
+            yield dict(zip(fields, (value.strip() for value in row)))
+
+
+def iter_rows(file, file_format, fields, header=False):
+    if file_format == "json":
+        return (
+            {field: str(item[field]).strip() for field in fields}
+            for item in iter_json_array(file)
+        )
+    return iter_csv_rows(file, fields, header)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def import_ingredients(rows, batch_size=1000):
+    """Add the ingredients that are not in the catalogue yet.
+
+    The rows are inserted in batches ignoring the ones that conflict on the
+    name and measurement unit, so running it again changes nothing.
+    Returns the numbers of rows read and ingredients added.
+    """
+    read = 0
+    count = Ingredient.objects.count()
+    for batch in batched(rows, batch_size):
+        read += len(batch)
+        unique = {
+            (row["name"], row["measurement_unit"]): None for row in batch
+        }
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in unique
+            ],
+            ignore_conflicts=True,
+        )
+    return read, Ingredient.objects.count() - count
+
+
+class _CsvStream:
+    """File-like object producing csv lines from the rows for COPY."""
+
+    def __init__(self, rows, fields):
+        self.rows = iter(rows)
+        self.fields = fields
+        self.buffer = ""
+        self.writer = csv.writer(self, lineterminator="\n")
+        self.read_rows = 0
+
+    def write(self, line):
+        self.buffer += line
+
+    def read(self, size=-1):
+        """Whole lines of at least ``size`` characters until rows run out."""
+        self.buffer = ""
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.read_rows += 1
+            self.writer.writerow([row[field] for field in self.fields])
+        return self.buffer
+
+
+def copy_ingredients(rows):
+    """Load the ingredients with PostgreSQL COPY through a temporary table.
+
+    Much faster than inserts for an initial load, the rows already in the
+    catalogue are skipped the same way. Returns the numbers of rows read
+    and ingredients added.
+    """
+    stream = _CsvStream(rows, INGREDIENT_FIELDS)
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMPORARY TABLE ingredient_import "
+            "(name varchar(200), measurement_unit varchar(100)) "
+            "ON COMMIT DROP"
+        )
+        cursor.copy_expert(
+            "COPY ingredient_import (name, measurement_unit) "
+            "FROM STDIN WITH (FORMAT csv)",
+            stream,
+        )
+        cursor.execute(
+            f"INSERT INTO {table} (name, measurement_unit) "
+            "SELECT DISTINCT name, measurement_unit FROM ingredient_import "
+            "ON CONFLICT DO NOTHING"
+        )
+        added = cursor.rowcount
+    return stream.read_rows, added
+
+
+def import_tags(rows):
+    """Create the tags and update the names and colors of existing ones.
+
+    Tags are matched by slug. Returns the numbers of tags read, added and
+    updated.
+    """
+    tags = {row["slug"]: row for row in rows}
+    existing = Tag.objects.in_bulk(list(tags), field_name="slug")
+    changed = []
+    for slug, tag in existing.items():
+        row = tags.pop(slug)
+        if (tag.name, tag.color) != (row["name"], row["color"]):
+            tag.name, tag.color = row["name"], row["color"]
+            changed.append(tag)
+    with transaction.atomic():
+        Tag.objects.bulk_update(changed, ["name", "color"])
+        Tag.objects.bulk_create(Tag(**row) for row in tags.values())
+    return len(existing) + len(tags), len(tags), len(changed)
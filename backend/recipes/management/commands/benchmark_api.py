@@ -0,0 +1,304 @@
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.management.commands.seed_benchmark import PASSWORD
+from recipes.models import FavoriteRecipe, Ingredient, Recipe, ShoppingCart
+from tags.models import Tag
+from users.models import Follow, User
+
+
+def get_endpoints(user):
+    """(name, method, path, data) of every endpoint of the API.
+
+    Writes are requested in a transaction that is rolled back, so every
+    run sees the same data. Creating recipes is left out: the photo it
+    stores would stay behind.
+    """
+    own = Recipe.objects.filter(author=user).first()
+    other = Recipe.objects.exclude(author=user).exclude(
+        favorites__user=user
+    ).exclude(shopping_cart__user=user).first()
+    favorite = FavoriteRecipe.objects.filter(user=user).first()
+    cart = ShoppingCart.objects.filter(user=user).first()
+    follow = Follow.objects.filter(user=user).first()
+    author = User.objects.exclude(pk=user.pk).exclude(
+        following__user=user
+    ).first()
+    ingredient = Ingredient.objects.first()
+    tag = Tag.objects.first()
+    if None in (own, other, favorite, cart, follow, author, ingredient, tag):
+        raise CommandError(
+            f"{user} needs recipes, favorites, a cart and follows, "
+            "run seed_benchmark"
+        )
+    recipe_update = {
+        "name": own.name,
+        "text": own.text,
+        "cooking_time": own.cooking_time,
+        "tags": list(own.tags.values_list("pk", flat=True)),
+        "ingredients": [
+            {"id": ingredient_id, "amount": amount + 1}
+            for ingredient_id, amount in own.recipe_ingredient.values_list(
+                "ingredient", "amount"
+            )
+        ],
+    }
+    return [
+        ("tags", "get", "/api/tags/", None),
+        ("tag", "get", f"/api/tags/{tag.pk}/", None),
+        ("ingredients search", "get", "/api/ingredients/?name=мук", None),
+        ("ingredient", "get", f"/api/ingredients/{ingredient.pk}/", None),
+        ("recipes", "get", "/api/recipes/", None),
+        ("recipes, 50", "get", "/api/recipes/?limit=50", None),
+        (
+            "recipes, filtered",
+            "get",
+            f"/api/recipes/?tags={tag.slug}&is_favorited=1",
+            None,
+        ),
+        ("recipes, popular", "get", "/api/recipes/?ordering=popular", None),
+        ("recipe", "get", f"/api/recipes/{own.pk}/", None),
+        ("update recipe", "patch", f"/api/recipes/{own.pk}/", recipe_update),
+        ("delete recipe", "delete", f"/api/recipes/{own.pk}/", None),
+        ("favorite", "post", f"/api/recipes/{other.pk}/favorite/", None),
+        (
+            "unfavorite",
+            "delete",
+            f"/api/recipes/{favorite.recipe_id}/favorite/",
+            None,
+        ),
+        (
+            "favorite many",
+            "post",
+            "/api/recipes/favorite/",
+            {"recipes": [other.pk, own.pk]},
+        ),
+        (
+            "add to cart",
+            "post",
+            f"/api/recipes/{other.pk}/shopping_cart/",
+            None,
+        ),
+        (
+            "remove from cart",
+            "delete",
+            f"/api/recipes/{cart.recipe_id}/shopping_cart/",
+            None,
+        ),
+        (
+            "add many to cart",
+            "post",
+            "/api/recipes/shopping_cart/",
+            {"recipes": [other.pk, own.pk]},
+        ),
+        (
+            "download cart",
+            "get",
+            "/api/recipes/download_shopping_cart/",
+            None,
+        ),
+        (
+            "download cart, pdf",
+            "get",
+            "/api/recipes/download_shopping_cart/?format=pdf",
+            None,
+        ),
+        ("users", "get", "/api/users/", None),
+        ("user", "get", f"/api/users/{author.pk}/", None),
+        ("me", "get", "/api/users/me/", None),
+        ("subscriptions", "get", "/api/users/subscriptions/", None),
+        ("subscribe", "post", f"/api/users/{author.pk}/subscribe/", None),
+        (
+            "unsubscribe",
+            "delete",
+            f"/api/users/{follow.author_id}/subscribe/",
+            None,
+        ),
+        (
+            "log in",
+            "post",
+            "/api/auth/token/login/",
+            {"email": user.email, "password": PASSWORD},
+        ),
+    ]
+
+
+def get_label():
+    """Short hash of the checked out commit, if there is one."""
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+    return result.stdout.strip()
+
+
+class Command(BaseCommand):
+    help = (
+        "request every API endpoint and record its query count, time and "
+        "allocated memory, on a database filled by seed_benchmark"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=20)
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="clear the cache before every run",
+        )
+        parser.add_argument(
+            "--user",
+            type=int,
+            help="id of the user to request as, a seeded user by default",
+        )
+        parser.add_argument(
+            "--only", action="append", help="endpoint name, repeatable"
+        )
+        parser.add_argument("-o", "--output", help="json file for results")
+        parser.add_argument(
+            "--compare", help="json file of earlier results to compare with"
+        )
+        parser.add_argument(
+            "--label", help="name of the results, the git commit by default"
+        )
+
+    def handle(self, *args, **options):
+        if options["runs"] < 1:
+            raise CommandError("--runs must be positive")
+        user = self.get_user(options["user"])
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        endpoints = get_endpoints(user)
+        if options["only"]:
+            endpoints = [
+                endpoint
+                for endpoint in endpoints
+                if endpoint[0] in options["only"]
+            ]
+        results = {}
+        for name, method, path, data in endpoints:
+            results[name] = self.measure(
+                client, method, path, data, options["runs"], options["cold"]
+            )
+            self.stdout.write(self.format(name, results[name]))
+        report = {
+            "label": options["label"] or get_label(),
+            "date": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "users": User.objects.count(),
+            "recipes": Recipe.objects.count(),
+            "runs": options["runs"],
+            "cold": options["cold"],
+            "endpoints": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options["compare"]:
+            self.compare(options["compare"], results)
+
+    def get_user(self, pk):
+        if pk:
+            return User.objects.get(pk=pk)
+        user = (
+            User.objects.filter(
+                username__startswith="bench",
+                shopping_cart__isnull=False,
+                follower__isnull=False,
+                favorites_user__isnull=False,
+                recipes__isnull=False,
+            )
+            .order_by("pk")
+            .first()
+        )
+        if user is None:
+            raise CommandError("no seeded users, run seed_benchmark")
+        return user
+
+    @staticmethod
+    def read(response):
+        """The content of the response, streamed ones read to the end."""
+        if response.streaming:
+            return b"".join(response.streaming_content)
+        return response.content
+
+    def request(self, client, method, path, data):
+        if method == "get":
+            response = client.get(path)
+            return response, self.read(response)
+        with transaction.atomic():
+            response = getattr(client, method)(path, data, format="json")
+            content = self.read(response)
+            transaction.set_rollback(True)
+        return response, content
+
+    def measure(self, client, method, path, data, runs, cold):
+        if not cold:
+            self.request(client, method, path, data)
+        timings = []
+        queries = 0
+        for _ in range(runs):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response, content = self.request(client, method, path, data)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(context))
+        if cold:
+            cache.clear()
+        tracemalloc.start()
+        self.request(client, method, path, data)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        timings.sort()
+        return {
+            "method": method.upper(),
+            "path": path,
+            "status": response.status_code,
+            "queries": queries,
+            "mean_ms": round(statistics.mean(timings), 2),
+            "p50_ms": round(timings[len(timings) // 2], 2),
+            "p95_ms": round(timings[int(len(timings) * 0.95)], 2),
+            "peak_kib": round(peak / 1024, 1),
+            "bytes": len(content),
+        }
+
+    @staticmethod
+    def format(name, result):
+        return (
+            f"{name:<20} {result['status']} {result['queries']:>3} queries "
+            f"p50 {result['p50_ms']:>8.2f} ms p95 {result['p95_ms']:>8.2f} "
+            f"ms {result['peak_kib']:>9.1f} KiB {result['bytes']:>8} bytes"
+        )
+
+    def compare(self, path, results):
+        with open(path, encoding="utf-8") as file:
+            before = json.load(file)
+        self.stdout.write(f"\ncompared with {before.get('label') or path}:")
+        for name, result in results.items():
+            old = before["endpoints"].get(name)
+            if old is None:
+                continue
+            self.stdout.write(
+                f"{name:<20} queries {old['queries']:>3} -> "
+                f"{result['queries']:<3} p50 {old['p50_ms']:>8.2f} -> "
+                f"{result['p50_ms']:<8.2f} ms "
+                f"({(result['p50_ms'] / old['p50_ms'] - 1) * 100:+.0f}%)"
+            )
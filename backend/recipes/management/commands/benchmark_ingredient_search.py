@@ -0,0 +1,105 @@
+import csv
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipes.filters import IngredientSearchFilter
+from recipes.models import Ingredient
+from recipes.search import IngredientIndex
+
+PATH = "backend/data"
+
+
+class Command(BaseCommand):
+    help = "measure ingredient search latency on names from ingredients.csv"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=1000)
+        parser.add_argument("--limit", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--index",
+            action="store_true",
+            help="search the in-memory index instead of the database",
+        )
+        parser.add_argument(
+            "--size",
+            type=int,
+            help="number of synthetic ingredients to index, "
+            "the names from the csv file by default",
+        )
+
+    def handle(self, *args, **options):
+        with open(f"{PATH}/ingredients.csv", encoding="utf-8") as file:
+            rows = [row for row in csv.reader(file) if row]
+        names = [row[0] for row in rows]
+        rng = random.Random(options["seed"])
+        terms = []
+        for _ in range(options["queries"]):
+            name = rng.choice(names)
+            start = rng.randrange(max(len(name) - 2, 1))
+            terms.append(name[start:start + rng.randint(1, 4)])
+
+        if options["index"]:
+            search, description = self.build_index(rows, options["size"])
+        else:
+            filter_search = IngredientSearchFilter().search_name
+
+            def search(term, limit):
+                return list(
+                    filter_search(Ingredient.objects.all(), "name", term)[
+                        :limit
+                    ]
+                )
+
+            description = (
+                f"{connection.vendor}, "
+                f"{Ingredient.objects.count()} ingredients"
+            )
+
+        timings = []
+        found = 0
+        for term in terms:
+            started = time.perf_counter()
+            found += len(search(term, options["limit"]))
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        self.stdout.write(
+            f"{description}, {len(terms)} queries, "
+            f"{found / len(terms):.1f} rows per query\n"
+            f"mean {statistics.mean(timings):.3f} ms, "
+            f"p50 {timings[len(timings) // 2]:.3f} ms, "
+            f"p99 {timings[int(len(timings) * 0.99)]:.3f} ms"
+        )
+
+    @staticmethod
+    def build_index(rows, size):
+        """Index the csv rows, repeated with a numeric suffix up to size."""
+        if size is None:
+            size = len(rows)
+        ingredients = (
+            (
+                position + 1,
+                name if copy == 0 else f"{name} {copy}",
+                measurement_unit,
+            )
+            for position in range(size)
+            for copy, (name, measurement_unit) in (
+                (position // len(rows), rows[position % len(rows)]),
+            )
+        )
+        tracemalloc.start()
+        started = time.perf_counter()
+        index = IngredientIndex(ingredients)
+        build_time = time.perf_counter() - started
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return index.search, (
+            f"in-memory index, {len(index)} ingredients, "
+            f"built in {build_time:.2f} s, {memory / 2 ** 20:.1f} MiB"
+        )
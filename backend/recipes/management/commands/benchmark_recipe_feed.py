@@ -0,0 +1,56 @@
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from recipes.models import Recipe
+from recipes.views import RecipeViewSet
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "measure the size and render time of a page of the recipe feed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=50)
+        parser.add_argument("--runs", type=int, default=20)
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="clear the cache before every run",
+        )
+        parser.add_argument(
+            "--user", type=int, help="id of the user to request as"
+        )
+
+    def handle(self, *args, **options):
+        view = RecipeViewSet.as_view({"get": "list"})
+        factory = APIRequestFactory()
+        user = (
+            User.objects.get(pk=options["user"]) if options["user"] else None
+        )
+        timings = []
+        size = 0
+        for _ in range(options["runs"]):
+            if options["cold"]:
+                cache.clear()
+            request = factory.get("/api/recipes/", {"limit": options["limit"]})
+            if user is not None:
+                force_authenticate(request, user)
+            started = time.perf_counter()
+            response = view(request).render()
+            timings.append((time.perf_counter() - started) * 1000)
+            size = len(response.content)
+
+        timings.sort()
+        self.stdout.write(
+            f"{Recipe.objects.count()} recipes, page of "
+            f"{min(options['limit'], Recipe.objects.count())}, "
+            f"{'cold' if options['cold'] else 'warm'} cache, "
+            f"{size / 1024:.1f} KiB\n"
+            f"mean {statistics.mean(timings):.1f} ms, "
+            f"p50 {timings[len(timings) // 2]:.1f} ms, "
+            f"max {timings[-1]:.1f} ms"
+        )
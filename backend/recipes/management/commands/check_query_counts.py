@@ -0,0 +1,175 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from backend.querycount import (
+    SIZES,
+    QueryBudgetExceeded,
+    assert_constant_queries,
+)
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+)
+from recipes.services import rebuild_cart_totals
+from tags.models import Tag
+from users.models import Follow, User
+
+PREFIX = "query-count"
+# The most queries each endpoint may run, whatever the number of items.
+BUDGETS = {
+    "recipe list": 5,
+    "recipe list, cursor": 4,
+    "recipe detail": 4,
+    "users list": 2,
+    "subscriptions": 3,
+    "shopping cart download": 2,
+    "ingredient search": 1,
+}
+
+
+class Data:
+    """Rows for the checks, made inside the transaction rolled back."""
+
+    def __init__(self, size):
+        self.user = User.objects.create(
+            username=PREFIX, email=f"{PREFIX}@example.com"
+        )
+        User.objects.bulk_create(
+            User(username=f"{PREFIX}-{number}", email=f"{number}@example.com")
+            for number in range(size)
+        )
+        # Not every database sets the primary keys of bulk created rows.
+        self.authors = list(
+            User.objects.filter(username__startswith=f"{PREFIX}-")
+        )
+        self.tag = Tag.objects.create(
+            name=PREFIX, color="#0a0b0c", slug=PREFIX
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"{PREFIX} {number}", measurement_unit="г")
+            for number in range(size)
+        )
+        self.ingredients = list(
+            Ingredient.objects.filter(name__startswith=PREFIX)
+        )
+        self.recipes = [self.add_recipe(author, 3) for author in self.authors]
+        self.by_ingredients = {
+            count: self.add_recipe(self.user, count) for count in SIZES
+        }
+        Follow.objects.bulk_create(
+            Follow(user=self.user, author=author) for author in self.authors
+        )
+
+    def add_recipe(self, author, ingredients):
+        recipe = Recipe.objects.create(
+            author=author,
+            name=PREFIX,
+            text=PREFIX,
+            cooking_time=1,
+            image=f"recipes/{PREFIX}.jpg",
+        )
+        recipe.tags.add(self.tag)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in self.ingredients[:ingredients]
+        )
+        return recipe
+
+    def fill_cart(self, size):
+        ShoppingCart.objects.filter(user=self.user).delete()
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=self.user, recipe=recipe)
+            for recipe in self.recipes[:size]
+        )
+        rebuild_cart_totals([self.user])
+
+
+def get_checks(client, data):
+    """(name, request of size items, setup) of the endpoints to check."""
+
+    def get(path, **params):
+        # Nothing is served from the cache, the full cost is counted.
+        cache.clear()
+        response = client.get(path, params)
+        if response.status_code != 200:
+            raise QueryBudgetExceeded(f"{path}: {response.status_code}")
+        if response.streaming:
+            b"".join(response.streaming_content)
+
+    def search(size):
+        with override_settings(INGREDIENT_SEARCH_LIMIT=size):
+            get("/api/ingredients/", name=PREFIX)
+
+    return [
+        (
+            "recipe list",
+            lambda size: get("/api/recipes/", limit=size),
+            None,
+        ),
+        (
+            "recipe list, cursor",
+            lambda size: get("/api/recipes/", limit=size, cursor=""),
+            None,
+        ),
+        (
+            "recipe detail",
+            lambda size: get(f"/api/recipes/{data.by_ingredients[size].id}/"),
+            None,
+        ),
+        (
+            "users list",
+            lambda size: get("/api/users/", limit=size),
+            None,
+        ),
+        (
+            "subscriptions",
+            lambda size: get("/api/users/subscriptions/", limit=size),
+            None,
+        ),
+        (
+            "shopping cart download",
+            lambda size: get("/api/recipes/download_shopping_cart/"),
+            data.fill_cart,
+        ),
+        ("ingredient search", search, None),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "check that the main endpoints run the same number of queries for "
+        f"{', '.join(map(str, SIZES))} items, within their budgets"
+    )
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": PREFIX,
+            }
+        }
+    )
+    def handle(self, *args, **options):
+        failed = []
+        with transaction.atomic():
+            data = Data(max(SIZES))
+            client = APIClient()
+            client.force_authenticate(data.user)
+            for name, func, setup in get_checks(client, data):
+                try:
+                    counts = assert_constant_queries(
+                        func, limit=BUDGETS[name], setup=setup
+                    )
+                except QueryBudgetExceeded as error:
+                    self.stdout.write(f"FAIL {name}\n{error}")
+                    failed.append(name)
+                else:
+                    self.stdout.write(f"ok   {name}: {counts}")
+            transaction.set_rollback(True)
+        if failed:
+            raise CommandError(f"over the query budget: {failed}")
@@ -0,0 +1,174 @@
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from recipes.filters import RecipeFilter
+from recipes.models import (
+    FavoriteRecipe,
+    Ingredient,
+    Recipe,
+    ShoppingCart,
+    ShoppingCartIngredient,
+    Tag,
+)
+from users.models import Follow, User
+
+# Indexes serving the rows of a user: the unique constraint or, as
+# PostgreSQL may prefer, the foreign key index on user_id.
+FAVORITE_INDEXES = [
+    "unique_favorite",
+    "autoindex_recipes_favoriterecipe",
+    "recipes_favoriterecipe_user_id",
+]
+CART_INDEXES = [
+    "unique_shopping_cart",
+    "autoindex_recipes_shoppingcart_",
+    "recipes_shoppingcart_user_id",
+]
+FOLLOW_INDEXES = [
+    "unique_follow",
+    "autoindex_users_follow",
+    "users_follow_user_id",
+]
+
+
+def get_checks():
+    """Query shapes of the main endpoints and the indexes they must use.
+
+    Each check lists groups of index names: the plan has to mention one
+    name of every group. SQLite names the indexes of unique constraints
+    ``sqlite_autoindex_<table>_N``. No check may need DISTINCT.
+    """
+    user = User(pk=1)
+    recipe_filter = RecipeFilter(request=SimpleNamespace(user=user))
+    filtered = recipe_filter.filter_tags(
+        Recipe.objects.filter(author=user), "tags", [Tag(pk=1), Tag(pk=2)]
+    )
+    filtered = recipe_filter.get_is_favorited(filtered, "is_favorited", True)
+    filtered = recipe_filter.get_is_in_shopping_cart(
+        filtered, "is_in_shopping_cart", True
+    )
+    checks = [
+        (
+            "recipe feed",
+            Recipe.objects.all()[:6],
+            [["recipe_pub_date_id_idx"]],
+        ),
+        (
+            "popular feed",
+            Recipe.objects.order_by("-popular_score", "-id")[:6],
+            [["recipe_popular_score_idx"]],
+        ),
+        (
+            "trending feed",
+            Recipe.objects.order_by("-trending_score", "-id")[:6],
+            [["recipe_trending_score_idx"]],
+        ),
+        (
+            "recipes of an author",
+            Recipe.objects.filter(author=user)[:6],
+            [["recipe_author_pub_date_idx"]],
+        ),
+        (
+            "filtered feed",
+            filtered[:6],
+            [
+                ["recipe_author_pub_date_idx"],
+                FAVORITE_INDEXES,
+                CART_INDEXES,
+                ["recipes_recipe_tags", "autoindex_recipes_recipe_tags"],
+            ],
+        ),
+        (
+            "flags of the current user",
+            Recipe.objects.with_user_flags(user)[:6],
+            [
+                FAVORITE_INDEXES,
+                CART_INDEXES,
+                FOLLOW_INDEXES,
+            ],
+        ),
+        (
+            "favorites of a user",
+            FavoriteRecipe.objects.filter(user=user),
+            [FAVORITE_INDEXES],
+        ),
+        (
+            "shopping cart of a user",
+            ShoppingCart.objects.filter(user=user),
+            [CART_INDEXES],
+        ),
+        (
+            "subscriptions of a user",
+            Follow.objects.filter(user=user),
+            [FOLLOW_INDEXES],
+        ),
+        (
+            "shopping list of a user",
+            ShoppingCartIngredient.objects.filter(user=user),
+            [
+                [
+                    "unique_shopping_cart_ingredient",
+                    "autoindex_recipes_shoppingcartingredient",
+                    "recipes_shoppingcartingredient_user_id",
+                ]
+            ],
+        ),
+        (
+            "ingredient by name and unit",
+            Ingredient.objects.filter(name="соль", measurement_unit="г"),
+            [["unique_ingredient_name_unit", "autoindex_recipes_ingredient"]],
+        ),
+    ]
+    if connection.vendor == "postgresql":
+        checks.append(
+            (
+                "ingredient search",
+                Ingredient.objects.filter(name__icontains="мук"),
+                [["recipes_ingredient_name_trgm"]],
+            )
+        )
+    return checks
+
+
+def get_missing_indexes(queryset, index_groups):
+    """The plan of the queryset, and what it misses of the index groups."""
+    plan = queryset.explain()
+    missing = [
+        group
+        for group in index_groups
+        if not any(index in plan for index in group)
+    ]
+    if "DISTINCT" in str(queryset.query):
+        missing.append(["no DISTINCT"])
+    return plan, missing
+
+
+def prefer_indexes():
+    """Keep PostgreSQL from scanning tables too small for indexes to pay."""
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+
+
+class Command(BaseCommand):
+    help = "check that the main API queries are planned with their indexes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--show-plans", action="store_true", help="print every plan"
+        )
+
+    def handle(self, *args, **options):
+        prefer_indexes()
+        failed = []
+        for name, queryset, index_groups in get_checks():
+            plan, missing = get_missing_indexes(queryset, index_groups)
+            self.stdout.write(f"{'FAIL' if missing else 'ok  '} {name}")
+            if missing or options["show_plans"]:
+                self.stdout.write(plan)
+            if missing:
+                failed.append(name)
+        if failed:
+            raise CommandError(f"not using the expected indexes: {failed}")
@@ -0,0 +1,50 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.fixtures import dump_fixture, get_dump_models
+
+
+class Command(BaseCommand):
+    help = (
+        "dump the data as a json fixture like dumpdata, reading the tables "
+        "in batches and writing as it goes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "labels",
+            nargs="*",
+            metavar="app_label[.ModelName]",
+            help="all the models by default",
+        )
+        parser.add_argument(
+            "-e",
+            "--exclude",
+            action="append",
+            default=[],
+            help="app_label or app_label.ModelName to skip, repeatable",
+        )
+        parser.add_argument(
+            "-o", "--output", help="file to write, stdout by default"
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        model_list = get_dump_models(options["labels"], options["exclude"])
+        if not model_list:
+            raise CommandError("no models to dump")
+        started = time.perf_counter()
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                counts = dump_fixture(file, model_list, options["batch_size"])
+        else:
+            counts = dump_fixture(
+                sys.stdout, model_list, options["batch_size"]
+            )
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        self.stderr.write(
+            f"dumped {total} rows of {len(counts)} models in {elapsed:.2f} s"
+        )
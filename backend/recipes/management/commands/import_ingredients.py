@@ -0,0 +1,103 @@
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from recipes.cache import bump_shared_cache_versions, get_local_cache_notice
+from recipes.importers import (
+    INGREDIENT_FIELDS,
+    TAG_FIELDS,
+    copy_ingredients,
+    import_ingredients,
+    import_tags,
+    iter_rows,
+)
+
+PATH = "backend/data"
+
+
+class Command(BaseCommand):
+    help = "import ingredients and tags from csv or json files"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            default=f"{PATH}/ingredients.csv",
+            help="csv rows of name,measurement_unit or a json array of "
+            "objects with these keys",
+        )
+        parser.add_argument(
+            "--tags",
+            metavar="PATH",
+            help="also import tags: csv rows of name,color,slug or a json "
+            f"array, e.g. {PATH}/tags.json",
+        )
+        parser.add_argument(
+            "--format",
+            choices=("csv", "json"),
+            help="format of the files, guessed from the extension by default",
+        )
+        parser.add_argument(
+            "--header",
+            action="store_true",
+            help="skip the first row of csv files",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--copy",
+            action="store_true",
+            help="load the ingredients with COPY, PostgreSQL only",
+        )
+
+    def handle(self, *args, **options):
+        if options["copy"] and connection.vendor != "postgresql":
+            raise CommandError("--copy needs PostgreSQL")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+        if options["tags"]:
+            with self.open(options["tags"], options) as (file, file_format):
+                started = time.perf_counter()
+                read, added, updated = import_tags(
+                    iter_rows(file, file_format, TAG_FIELDS, options["header"])
+                )
+            self.report(
+                "tags", read, started, f"{added} added, {updated} updated"
+            )
+        with self.open(options["path"], options) as (file, file_format):
+            rows = iter_rows(
+                file, file_format, INGREDIENT_FIELDS, options["header"]
+            )
+            started = time.perf_counter()
+            if options["copy"]:
+                read, added = copy_ingredients(rows)
+            else:
+                read, added = import_ingredients(rows, options["batch_size"])
+        self.report("ingredients", read, started, f"{added} added")
+        namespaces = ["ingredients"] + (["tags"] if options["tags"] else [])
+        if not bump_shared_cache_versions(*namespaces):
+            self.stdout.write(self.style.WARNING(get_local_cache_notice()))
+
+    @contextmanager
+    def open(self, path, options):
+        path = Path(path)
+        file_format = options["format"] or path.suffix.lstrip(".").lower()
+        if file_format not in ("csv", "json"):
+            raise CommandError(f"unknown format of {path}, use --format")
+        try:
+            file = path.open(encoding="utf-8", newline="")
+        except OSError as error:
+            raise CommandError(error)
+        with file:
+            yield file, file_format
+
+    def report(self, name, read, started, result):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{name}: {read} rows read, {result} in {elapsed:.2f} s "
+                f"({read / elapsed if elapsed else 0:.0f} rows/s)"
+            )
+        )
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, IntegrityError
+
+from recipes.fixtures import FixtureLoader
+from recipes.cache import get_local_cache_notice
+from recipes.services import rebuild_derived_data
+
+
+class Command(BaseCommand):
+    help = (
+        "load a large json fixture in bulk, streaming it from the file; "
+        "the counters, scores and shopping lists are recomputed afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="fixture made by dumpdata")
+        parser.add_argument(
+            "-e",
+            "--exclude",
+            action="append",
+            default=[],
+            help="app_label or app_label.ModelName to skip, repeatable",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--ignore-existing",
+            action="store_true",
+            help="skip the rows whose keys already exist instead of failing",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+        loader = FixtureLoader(
+            batch_size=options["batch_size"],
+            exclude=options["exclude"],
+            ignore_conflicts=options["ignore_existing"],
+        )
+        started = time.perf_counter()
+        try:
+            with open(options["path"], encoding="utf-8") as file:
+                counts = loader.load(file)
+        except (OSError, ValueError, IntegrityError, DatabaseError) as error:
+            raise CommandError(f"cannot load {options['path']}: {error}")
+        elapsed = time.perf_counter() - started
+        for label, rows in counts.items():
+            self.stdout.write(f"{label}: {rows}")
+        total = sum(counts.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{total} rows in {elapsed:.2f} s "
+                f"({total / elapsed if elapsed else 0:.0f} rows/s)"
+            )
+        )
+        if not rebuild_derived_data():
+            self.stdout.write(self.style.WARNING(get_local_cache_notice()))
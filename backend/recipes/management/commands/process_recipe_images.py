@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.images import get_pending_recipes, process_recipe_image
+
+
+class Command(BaseCommand):
+    help = (
+        "make the resized variants of the recipe images that lack them, "
+        "with --watch keep doing it as a background worker"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="keep looking for new images instead of exiting",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="seconds between the checks with --watch",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            pending = list(get_pending_recipes().values_list("pk", flat=True))
+            processed = sum(process_recipe_image(pk) for pk in pending)
+            if processed or not options["watch"]:
+                self.stdout.write(
+                    self.style.SUCCESS(f"processed {processed} images")
+                )
+            if not options["watch"]:
+                return
+            time.sleep(options["interval"])
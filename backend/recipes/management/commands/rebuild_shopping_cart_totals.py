@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.services import check_cart_totals, rebuild_cart_totals
+
+
+class Command(BaseCommand):
+    help = "rebuild the precomputed shopping list totals from the carts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="only compare the stored totals with the carts",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            mismatches = check_cart_totals()
+            if mismatches:
+                raise CommandError(
+                    f"{len(mismatches)} totals are out of date, "
+                    f"first (user, ingredient): {mismatches[:10]}"
+                )
+            self.stdout.write(self.style.SUCCESS("shopping list totals ok"))
+            return
+        rows = rebuild_cart_totals()
+        self.stdout.write(
+            self.style.SUCCESS(f"rebuilt {rows} shopping list totals")
+        )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from recipes.cache import get_recipe_cache_stats
+
+
+class Command(BaseCommand):
+    help = "show the hit rate of the recipe representation cache"
+
+    def handle(self, *args, **options):
+        hits, misses = get_recipe_cache_stats()
+        total = hits + misses
+        hit_rate = hits / total if total else 0
+        self.stdout.write(
+            f"hits {hits}, misses {misses}, hit rate {hit_rate:.1%}"
+        )
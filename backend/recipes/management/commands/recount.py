@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.services import check_counters, recount_counters
+
+
+class Command(BaseCommand):
+    help = "recompute the favorites, cart, recipe and follower counters"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="only count the rows with stale counters",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            stale = {
+                field: rows for field, rows in check_counters().items() if rows
+            }
+            if stale:
+                raise CommandError(f"stale counters: {stale}")
+            self.stdout.write(self.style.SUCCESS("counters ok"))
+            return
+        changed = recount_counters()
+        self.stdout.write(
+            self.style.SUCCESS(
+                ", ".join(
+                    f"{field}: {rows} updated"
+                    for field, rows in changed.items()
+                )
+            )
+        )
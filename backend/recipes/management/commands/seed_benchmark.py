@@ -0,0 +1,257 @@
+import io
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from recipes.cache import get_local_cache_notice
+from recipes.images import make_image_variants
+from recipes.importers import (
+    INGREDIENT_FIELDS,
+    TAG_FIELDS,
+    import_ingredients,
+    import_tags,
+    iter_rows,
+)
+from recipes.models import (
+    FavoriteRecipe,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+)
+from recipes.services import rebuild_derived_data
+from tags.models import Tag
+from users.models import Follow, User
+
+PATH = "backend/data"
+PASSWORD = "benchmark"
+IMAGE_NAME = "recipes/benchmark.jpg"
+WORDS = (
+    "Курица",
+    "по-домашнему",
+    "с овощами",
+    "Суп",
+    "Салат",
+    "Пирог",
+    "с сыром",
+    "на гриле",
+    "быстрый",
+    "Запеканка",
+    "из тыквы",
+    "с грибами",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "fill the database with synthetic users, recipes, follows, "
+        f"favorites and carts for benchmarks, the password is {PASSWORD}"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument(
+            "--recipes", type=int, default=5, help="recipes per user"
+        )
+        parser.add_argument(
+            "--follows", type=int, default=10, help="authors per user"
+        )
+        parser.add_argument(
+            "--favorites", type=int, default=20, help="recipes per user"
+        )
+        parser.add_argument(
+            "--carts", type=int, default=5, help="recipes per user"
+        )
+        parser.add_argument("--min-ingredients", type=int, default=5)
+        parser.add_argument("--max-ingredients", type=int, default=20)
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=90,
+            help="recipes are published over this many last days, "
+            "favorites and carts added since",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not 1 <= options["min_ingredients"] <= options["max_ingredients"]:
+            raise CommandError("bad --min-ingredients or --max-ingredients")
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.load_catalogue()
+        ingredient_ids = list(Ingredient.objects.values_list("pk", flat=True))
+        if len(ingredient_ids) < options["max_ingredients"]:
+            raise CommandError("not enough ingredients for --max-ingredients")
+        tag_ids = list(Tag.objects.values_list("pk", flat=True))
+        image_variants = self.make_image()
+        with transaction.atomic():
+            users = self.create_users(options["users"])
+            recipes = self.create_recipes(
+                users, options, ingredient_ids, tag_ids, image_variants
+            )
+            self.create_relations(users, recipes, options)
+        if not rebuild_derived_data():
+            self.stdout.write(self.style.WARNING(get_local_cache_notice()))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"added {len(users)} users and {len(recipes)} recipes, "
+                f"the database has {User.objects.count()} users and "
+                f"{Recipe.objects.count()} recipes"
+            )
+        )
+
+    def load_catalogue(self):
+        """Load the ingredients and tags shipped with the project."""
+        for path, fields, load in (
+            (f"{PATH}/ingredients.csv", INGREDIENT_FIELDS, import_ingredients),
+            (f"{PATH}/tags.json", TAG_FIELDS, import_tags),
+        ):
+            with open(path, encoding="utf-8", newline="") as file:
+                load(iter_rows(file, path.rsplit(".", 1)[1], fields))
+
+    def make_image(self):
+        """Store one photo shared by every recipe, with its variants."""
+        storage = Recipe._meta.get_field("image").storage
+        if not storage.exists(IMAGE_NAME):
+            image = Image.new("RGB", (1200, 800))
+            for x in range(0, 1200, 100):
+                for y in range(0, 800, 100):
+                    image.paste(
+                        tuple(self.rng.randrange(256) for _ in range(3)),
+                        (x, y, x + 100, y + 100),
+                    )
+            buffer = io.BytesIO()
+            image.save(buffer, "JPEG")
+            storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+        return make_image_variants(Recipe(image=IMAGE_NAME))
+
+    def create_users(self, count):
+        start = (User.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f"bench{number}",
+                    email=f"bench{number}@example.com",
+                    first_name=self.rng.choice(("Анна", "Иван", "Мария")),
+                    last_name=self.rng.choice(("Иванова", "Петров", "Ли")),
+                    password=password,
+                )
+                for number in range(start, start + count)
+            ),
+            batch_size=self.batch_size,
+        )
+        return list(
+            User.objects.filter(pk__gte=start).values_list("pk", flat=True)
+        )
+
+    def create_recipes(
+        self, users, options, ingredient_ids, tag_ids, image_variants
+    ):
+        start = (Recipe.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=author,
+                    name=" ".join(self.rng.sample(WORDS, 3)),
+                    text="Смешать, приготовить и подать. " * 5,
+                    cooking_time=self.rng.randint(5, 180),
+                    image=IMAGE_NAME,
+                    image_variants=image_variants,
+                    image_variants_source=IMAGE_NAME,
+                )
+                for author in users
+                for _ in range(options["recipes"])
+            ),
+            batch_size=self.batch_size,
+        )
+        recipes = list(
+            Recipe.objects.filter(pk__gte=start).values_list("pk", flat=True)
+        )
+        # pub_date is set on creation, spread it so the feeds are realistic.
+        now = timezone.now()
+        period = options["days"] * 24 * 60 * 60
+        dated = [
+            Recipe(
+                pk=pk,
+                pub_date=now - timedelta(seconds=self.rng.randrange(period)),
+            )
+            for pk in recipes
+        ]
+        Recipe.objects.bulk_update(
+            dated, ["pub_date"], batch_size=self.batch_size
+        )
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe_id=recipe,
+                    ingredient_id=ingredient,
+                    amount=self.rng.randint(1, 500),
+                )
+                for recipe in recipes
+                for ingredient in self.rng.sample(
+                    ingredient_ids,
+                    self.rng.randint(
+                        options["min_ingredients"], options["max_ingredients"]
+                    ),
+                )
+            ),
+            batch_size=self.batch_size,
+        )
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+                for recipe in recipes
+                for tag in self.rng.sample(
+                    tag_ids, self.rng.randint(1, min(len(tag_ids), 3))
+                )
+            ),
+            batch_size=self.batch_size,
+        )
+        return recipes
+
+    def sample(self, population, count):
+        return self.rng.sample(population, min(count, len(population)))
+
+    def create_relations(self, users, recipes, options):
+        now = timezone.now()
+        pub_dates = dict(
+            Recipe.objects.filter(pk__in=recipes).values_list("pk", "pub_date")
+        )
+
+        def added(recipe):
+            # Spread from the publication on, for the trending feed.
+            return {
+                "created": pub_dates[recipe]
+                + (now - pub_dates[recipe]) * self.rng.random()
+            }
+
+        for model, field, population, count, extra in (
+            (Follow, "author_id", users, options["follows"], lambda _: {}),
+            (
+                FavoriteRecipe,
+                "recipe_id",
+                recipes,
+                options["favorites"],
+                added,
+            ),
+            (ShoppingCart, "recipe_id", recipes, options["carts"], added),
+        ):
+            model.objects.bulk_create(
+                (
+                    model(user_id=user, **{field: other}, **extra(other))
+                    for user in users
+                    for other in self.sample(population, count)
+                    if other != user or field != "author_id"
+                ),
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
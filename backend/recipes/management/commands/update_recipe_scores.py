@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes.services import update_recipe_scores
+
+
+class Command(BaseCommand):
+    help = (
+        "recompute the scores of the popular and trending feeds, "
+        "meant to be run periodically"
+    )
+
+    def handle(self, *args, **options):
+        updated = update_recipe_scores()
+        self.stdout.write(self.style.SUCCESS(f"updated {updated} recipes"))
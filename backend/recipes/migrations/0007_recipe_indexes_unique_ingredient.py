@@ -0,0 +1,68 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:41
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Keep the first of the ingredients sharing a name and unit."""
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingCartIngredient = apps.get_model(
+        'recipes', 'ShoppingCartIngredient'
+    )
+    duplicates = (
+        Ingredient.objects.values('name', 'measurement_unit')
+        .annotate(keep_id=Min('id'), copies=Count('id'))
+        .filter(copies__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates:
+        keep_id = duplicate['keep_id']
+        drop_ids = list(
+            Ingredient.objects.filter(
+                name=duplicate['name'],
+                measurement_unit=duplicate['measurement_unit'],
+            )
+            .exclude(id=keep_id)
+            .values_list('id', flat=True)
+        )
+        for model, owner, amount in (
+            (RecipeIngredient, 'recipe_id', 'amount'),
+            (ShoppingCartIngredient, 'user_id', 'total_amount'),
+        ):
+            for row in model.objects.filter(ingredient_id__in=drop_ids):
+                kept = model.objects.filter(
+                    ingredient_id=keep_id, **{owner: getattr(row, owner)}
+                ).first()
+                if kept is None:
+                    row.ingredient_id = keep_id
+                    row.save(update_fields=['ingredient'])
+                    continue
+                setattr(
+                    kept, amount, getattr(kept, amount) + getattr(row, amount)
+                )
+                kept.save(update_fields=[amount])
+                row.delete()
+        Ingredient.objects.filter(id__in=drop_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_name_unit'),
+        ),
+    ]
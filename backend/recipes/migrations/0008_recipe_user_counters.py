@@ -0,0 +1,47 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:44
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    counters = (
+        ('recipes.Recipe', 'favorites_count', 'recipes.FavoriteRecipe',
+         'recipe'),
+        ('recipes.Recipe', 'in_carts_count', 'recipes.ShoppingCart', 'recipe'),
+        ('users.User', 'recipes_count', 'recipes.Recipe', 'author'),
+        ('users.User', 'followers_count', 'users.Follow', 'author'),
+    )
+    for model, field, related_model, related_field in counters:
+        related = apps.get_model(related_model)
+        count = Subquery(
+            related.objects.filter(**{related_field: OuterRef('pk')})
+            .order_by()
+            .values(related_field)
+            .annotate(count=Count('pk'))
+            .values('count')
+        )
+        apps.get_model(model).objects.update(**{field: Coalesce(count, 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_counters'),
+        ('recipes', '0007_recipe_indexes_unique_ingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном, раз'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок, раз'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
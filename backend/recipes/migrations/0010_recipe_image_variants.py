@@ -0,0 +1,23 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_scores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(default=dict, editable=False, help_text='Имена файлов по размеру и формату', verbose_name='Варианты фото'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants_source',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Фото, из которого сделаны варианты'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.15 on 2026-10-18 18:51
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.utils.timezone
+
+
+def date_existing_rows(apps, schema_editor):
+    # When the existing rows were added is unknown, the publication of
+    # their recipe is the earliest it can be: they do not all trend at once.
+    pub_date = Subquery(
+        apps.get_model('recipes.Recipe')
+        .objects.filter(pk=OuterRef('recipe_id'))
+        .values('pub_date')
+    )
+    for model in ('recipes.FavoriteRecipe', 'recipes.ShoppingCart'):
+        apps.get_model(model).objects.update(created=pub_date)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favoriterecipe',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Дата добавления'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Дата добавления'),
+        ),
+        migrations.RunPython(date_existing_rows, migrations.RunPython.noop),
+    ]
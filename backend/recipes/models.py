@@ -1,9 +1,11 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch, Value
+from django.utils import timezone
 
 from tags.models import Tag
-from users.models import User
+from users.models import Follow, User
 
 User = get_user_model()
 
@@ -24,11 +26,55 @@ class Ingredient(models.Model):
         ordering = ["id"]
         verbose_name = "Ингредиент"
         verbose_name_plural = "Ингредиенты"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["name", "measurement_unit"],
+                name="unique_ingredient_name_unit",
+            )
+        ]
 
     def __str__(self):
         return f"{self.name}, {self.measurement_unit}"
 
 
+def recipe_related_lookups():
+    """Lookups loading the author, tags and ingredients of recipes."""
+    return (
+        "author",
+        "tags",
+        Prefetch(
+            "recipe_ingredient",
+            queryset=RecipeIngredient.objects.select_related("ingredient"),
+        ),
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Recipe queryset with the helpers used to display recipes."""
+
+    def with_user_flags(self, user):
+        """Annotate the flags that depend on the current user."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()
+                ),
+                is_subscribed=Value(False, output_field=models.BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                FavoriteRecipe.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef("author"))
+            ),
+        )
+
+
 class Recipe(models.Model):
     """Recipe."""
 
@@ -56,6 +102,18 @@ class Recipe(models.Model):
         verbose_name="Фото готового блюда",
         upload_to="recipes/",
     )
+    image_variants = models.JSONField(
+        verbose_name="Варианты фото",
+        default=dict,
+        editable=False,
+        help_text="Имена файлов по размеру и формату",
+    )
+    image_variants_source = models.CharField(
+        verbose_name="Фото, из которого сделаны варианты",
+        max_length=100,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(verbose_name="Описание рецепта")
     cooking_time = models.PositiveSmallIntegerField(
         validators=[
@@ -68,11 +126,44 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         verbose_name="Дата публикации", auto_now_add=True
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="В избранном, раз", default=0, editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name="В списках покупок, раз", default=0, editable=False
+    )
+    popular_score = models.FloatField(
+        verbose_name="Популярность", default=0, editable=False
+    )
+    trending_score = models.FloatField(
+        verbose_name="Популярность с учётом давности",
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ["-pub_date"]
+        ordering = ["-pub_date", "-id"]
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"], name="recipe_pub_date_id_idx"
+            ),
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="recipe_author_pub_date_idx",
+            ),
+            models.Index(
+                fields=["-popular_score", "-id"],
+                name="recipe_popular_score_idx",
+            ),
+            models.Index(
+                fields=["-trending_score", "-id"],
+                name="recipe_trending_score_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -133,6 +224,9 @@ class FavoriteRecipe(models.Model):
         related_name="favorites",
         verbose_name="Рецепт",
     )
+    created = models.DateTimeField(
+        verbose_name="Дата добавления", default=timezone.now, editable=False
+    )
 
     class Meta:
         verbose_name = "Избранное"
@@ -162,6 +256,9 @@ class ShoppingCart(models.Model):
         related_name="shopping_cart",
         verbose_name="Покупка",
     )
+    created = models.DateTimeField(
+        verbose_name="Дата добавления", default=timezone.now, editable=False
+    )
 
     class Meta:
         verbose_name = "Покупка"
@@ -174,3 +271,36 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f"Рецепт {self.recipe} в списке покупок у {self.user}"
+
+
+class ShoppingCartIngredient(models.Model):
+    """Total amount of an ingredient in the user's shopping cart."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_cart_ingredients",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_cart_totals",
+        verbose_name="Ингредиент",
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name="Общее количество",
+    )
+
+    class Meta:
+        verbose_name = "Ингредиент в списке покупок"
+        verbose_name_plural = "Ингредиенты в списках покупок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="unique_shopping_cart_ingredient",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.total_amount} {self.ingredient} у {self.user}"
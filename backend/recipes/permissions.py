@@ -1,6 +1,15 @@
 from rest_framework import permissions
 
 
+class IsAdmin(permissions.BasePermission):
+    """Allowed by administrator only"""
+
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and (
+            request.user.is_admin or request.user.is_superuser
+        )
+
+
 class IsAdminOrReadOnly(permissions.BasePermission):
     """Allowed by administrator or read-only"""
 
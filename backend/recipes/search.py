@@ -0,0 +1,114 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+
+from .cache import get_cache_version
+from .models import Ingredient
+
+
+class IngredientIndex:
+    """In-memory ingredient search over a sorted array of casefolded names.
+
+    Prefix matches are found with a binary search; when there are fewer of
+    them than the limit the rest is filled with names containing the query,
+    the same ranking as ``IngredientSearchFilter``. Those are found with
+    ``str.find`` over all the names joined into one string.
+    """
+
+    def __init__(self, ingredients):
+        units = {}
+        rows = sorted(
+            (name.casefold(), name, pk, units.setdefault(unit, unit))
+            for pk, name, unit in ingredients
+        )
+        self.keys = [row[0] for row in rows]
+        self.names = [row[1] for row in rows]
+        self.ids = [row[2] for row in rows]
+        self.units = [row[3] for row in rows]
+        self.haystack = "\n".join(self.keys)
+        self.offsets = []
+        offset = 0
+        for key in self.keys:
+            self.offsets.append(offset)
+            offset += len(key) + 1
+
+    @classmethod
+    def from_db(cls):
+        return cls(
+            Ingredient.objects.values_list("id", "name", "measurement_unit")
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _item(self, position):
+        return {
+            "id": self.ids[position],
+            "name": self.names[position],
+            "measurement_unit": self.units[position],
+        }
+
+    def search(self, query, limit):
+        """Ingredients matching the query, prefix matches first."""
+        key = query.casefold()
+        start = bisect_left(self.keys, key)
+        end = start
+        while (
+            end < len(self.keys)
+            and end - start < limit
+            and self.keys[end].startswith(key)
+        ):
+            end += 1
+        positions = list(range(start, end))
+        offset = self.haystack.find(key) if key else -1
+        while offset != -1 and len(positions) < limit:
+            position = bisect_right(self.offsets, offset) - 1
+            name = self.keys[position]
+            if key in name and not name.startswith(key):
+                positions.append(position)
+            offset = self.haystack.find(
+                key, self.offsets[position] + len(name) + 1
+            )
+        return [self._item(position) for position in positions]
+
+
+_index_cache = {}
+_index_lock = threading.Lock()
+
+
+def _is_current(entry, version):
+    return (
+        entry is not None
+        and entry["version"] == version
+        and time.monotonic() - entry["built"] < settings.API_CACHE_TIMEOUT
+    )
+
+
+def get_ingredient_index():
+    """The index of the current process, built on first use.
+
+    It is rebuilt when the ingredients cache version changes, which a
+    shared cache carries over from the other processes, and at the latest
+    after ``API_CACHE_TIMEOUT`` for changes the version does not carry.
+    """
+    version = get_cache_version("ingredients")
+    entry = _index_cache.get("index")
+    if _is_current(entry, version):
+        return entry["index"]
+    with _index_lock:
+        entry = _index_cache.get("index")
+        if not _is_current(entry, version):
+            entry = _index_cache["index"] = {
+                "index": IngredientIndex.from_db(),
+                "version": version,
+                "built": time.monotonic(),
+            }
+        return entry["index"]
+
+
+def invalidate_ingredient_index():
+    """Drop the index so that the next search rebuilds it."""
+    with _index_lock:
+        _index_cache.pop("index", None)
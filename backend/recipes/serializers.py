@@ -1,19 +1,62 @@
+from django.db import transaction
+from django.db.models import Manager, prefetch_related_objects
 from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.validators import UniqueTogetherValidator
 
+from recipes.cache import (
+    get_recipe_fragments,
+    get_recipe_stamp,
+    set_recipe_fragments,
+)
+from recipes.images import (
+    RecipeImageField,
+    check_image_dimensions,
+    get_media_url,
+    image_url,
+)
 from recipes.models import (
     FavoriteRecipe,
     Ingredient,
     Recipe,
     RecipeIngredient,
     ShoppingCart,
+    recipe_related_lookups,
 )
+from recipes.services import change_counter
+from recipes.signals import recipe_ingredients_changed
 from tags.models import Tag
 from tags.serializers import TagSerializer
+from users.models import Follow, User
 from users.serializers import CustomUserSerializer
 
+BULK_RECIPES_LIMIT = 100
+FAVORITE_EXISTS_MESSAGE = "Рецепт уже в избранном"
+SHOPPING_CART_EXISTS_MESSAGE = "Рецепт уже в списке покупок"
+
+
+class BulkPrimaryKeyListField(serializers.ListField):
+    """A list of primary keys resolved with one ``in_bulk`` query.
+
+    All missing keys are reported together.
+    """
+
+    child = serializers.IntegerField(min_value=1)
+    default_error_messages = {"does_not_exist": "Объекты не найдены: {pks}"}
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        pks = super().to_internal_value(data)
+        objects = self.queryset.in_bulk(set(pks))
+        missing = [pk for pk in dict.fromkeys(pks) if pk not in objects]
+        if missing:
+            self.fail("does_not_exist", pks=", ".join(map(str, missing)))
+        return [objects[pk] for pk in pks]
+
 
 class IngredientSerializer(serializers.ModelSerializer):
     """Serializer for the output of ingredients."""
@@ -30,11 +73,27 @@ class IngredientSerializer(serializers.ModelSerializer):
 class ShortRecipeSerializer(serializers.ModelSerializer):
     """Serializer for a brief display of the recipe."""
 
+    image = RecipeImageField("thumbnail")
+
     class Meta:
         model = Recipe
         fields = ("id", "name", "image", "cooking_time")
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    """A list of recipe ids resolved to the recipes with one query."""
+
+    recipes = BulkPrimaryKeyListField(
+        queryset=Recipe.objects.all(),
+        allow_empty=False,
+        max_length=BULK_RECIPES_LIMIT,
+        error_messages={"does_not_exist": "Рецепты не найдены: {pks}"},
+    )
+
+    def validate_recipes(self, recipes):
+        return list(dict.fromkeys(recipes))
+
+
 class ShowIngredientsInRecipeSerializer(serializers.ModelSerializer):
     """Serializer for displaying ingredients in a recipe."""
 
@@ -54,22 +113,43 @@ class ShowIngredientsInRecipeSerializer(serializers.ModelSerializer):
         )
 
 
+class AddIngredientRecipeListSerializer(serializers.ListSerializer):
+    """Resolves the ingredients of all the items with one query."""
+
+    default_error_messages = {
+        "does_not_exist": "Ингредиенты не найдены: {pks}"
+    }
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        pks = [item["id"] for item in items]
+        ingredients = Ingredient.objects.in_bulk(set(pks))
+        missing = [pk for pk in dict.fromkeys(pks) if pk not in ingredients]
+        if missing:
+            self.fail("does_not_exist", pks=", ".join(map(str, missing)))
+        for item in items:
+            item["id"] = ingredients[item["id"]]
+        return items
+
+
 class AddIngredientRecipeSerializer(serializers.ModelSerializer):
     """A serializer for adding ingredients."""
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
 
     class Meta:
         model = RecipeIngredient
         fields = ("id", "amount")
+        list_serializer_class = AddIngredientRecipeListSerializer
 
 
 class AddRecipeSerializer(serializers.ModelSerializer):
     """Serializer for adding a recipe."""
 
     ingredients = AddIngredientRecipeSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True
+    tags = BulkPrimaryKeyListField(
+        queryset=Tag.objects.all(),
+        error_messages={"does_not_exist": "Теги не найдены: {pks}"},
     )
     image = Base64ImageField(use_url=True, max_length=None)
     name = serializers.CharField(max_length=200)
@@ -88,6 +168,11 @@ class AddRecipeSerializer(serializers.ModelSerializer):
             "author",
         )
 
+    def validate_image(self, image):
+        """Check the size of the photo from its header, not its pixels."""
+        check_image_dimensions(*image.image.size)
+        return image
+
     def validate(self, ingredients_):
         """Validation of ingredients for creating a recipe"""
 
@@ -121,6 +206,46 @@ class AddRecipeSerializer(serializers.ModelSerializer):
             )
         return ingredients_
 
+    @staticmethod
+    def __update_ingredients(ingredients, recipe):
+        """Apply the new ingredient list as a diff of the stored one.
+
+        Returns the ids of the added, removed and re-measured ingredients.
+        """
+        amounts = {
+            ingredient["id"].pk: ingredient["amount"]
+            for ingredient in ingredients
+        }
+        stored = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in RecipeIngredient.objects.filter(
+                recipe=recipe
+            )
+        }
+        removed = [pk for pk in stored if pk not in amounts]
+        changed = [
+            recipe_ingredient
+            for pk, recipe_ingredient in stored.items()
+            if pk in amounts and recipe_ingredient.amount != amounts[pk]
+        ]
+        for recipe_ingredient in changed:
+            recipe_ingredient.amount = amounts[recipe_ingredient.ingredient_id]
+        added = [
+            RecipeIngredient(recipe=recipe, ingredient_id=pk, amount=amount)
+            for pk, amount in amounts.items()
+            if pk not in stored
+        ]
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        RecipeIngredient.objects.bulk_update(changed, ["amount"])
+        RecipeIngredient.objects.bulk_create(added)
+        return removed + [
+            recipe_ingredient.ingredient_id
+            for recipe_ingredient in changed + added
+        ]
+
     @staticmethod
     def __add_ingredients(ingredients, recipe):
         ingredients_to_add = [
@@ -138,20 +263,29 @@ class AddRecipeSerializer(serializers.ModelSerializer):
         tags_data = validated_data.pop("tags")
         ingredients_data = validated_data.pop("ingredients")
         image = validated_data.pop("image")
-        recipe = Recipe.objects.create(
-            image=image, author=author, **validated_data
-        )
-        self.__add_ingredients(ingredients_data, recipe)
-        recipe.tags.set(tags_data)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(
+                image=image, author=author, **validated_data
+            )
+            self.__add_ingredients(ingredients_data, recipe)
+            recipe.tags.set(tags_data)
+            change_counter(
+                User.objects.filter(pk=author.pk), "recipes_count", 1
+            )
         return recipe
 
     def update(self, recipe, validated_data):
         ingredients = validated_data.pop("ingredients")
         tags = validated_data.pop("tags")
-        RecipeIngredient.objects.filter(recipe=recipe).delete()
-        self.__add_ingredients(ingredients, recipe)
-        recipe.tags.set(tags)
-        return super().update(recipe, validated_data)
+        with transaction.atomic():
+            ingredient_ids = self.__update_ingredients(ingredients, recipe)
+            recipe.tags.set(tags)
+            recipe = super().update(recipe, validated_data)
+            if ingredient_ids:
+                recipe_ingredients_changed.send(
+                    sender=Recipe, recipe=recipe, ingredient_ids=ingredient_ids
+                )
+        return recipe
 
     def to_representation(self, recipe):
         return ShowRecipeSerializer(
@@ -159,13 +293,29 @@ class AddRecipeSerializer(serializers.ModelSerializer):
         ).data
 
 
+class ShowRecipeListSerializer(serializers.ListSerializer):
+    """Displays a page of recipes with one cache lookup."""
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, Manager) else data
+        return self.child.to_representation_many(list(recipes))
+
+
 class ShowRecipeSerializer(serializers.ModelSerializer):
-    """Serializer for displaying the recipe."""
+    """Serializer for displaying the recipe.
+
+    The part of the representation that is the same for every user is
+    cached per recipe, the per-user flags are added on each request.
+    ``image`` is the medium variant of the photo in lists and the full one
+    for a single recipe, ``images`` lists all of them. Image URLs are built
+    from the stored names without touching the storage.
+    """
 
     tags = TagSerializer(many=True, read_only=True)
-    author = CustomUserSerializer(read_only=True)
+    author = serializers.SerializerMethodField()
     ingredients = serializers.SerializerMethodField()
-    image = Base64ImageField()
+    image = RecipeImageField("full")
+    images = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -179,19 +329,108 @@ class ShowRecipeSerializer(serializers.ModelSerializer):
             "ingredients",
             "name",
             "image",
+            "images",
             "text",
             "cooking_time",
             "is_in_shopping_cart",
         )
+        list_serializer_class = ShowRecipeListSerializer
+
+    def to_representation(self, recipe):
+        return self.to_representation_many([recipe], image_variant="full")[0]
+
+    def to_representation_many(self, recipes, image_variant="medium"):
+        stamp = get_recipe_stamp(self.context.get("request"))
+        fragments = get_recipe_fragments([r.pk for r in recipes], stamp)
+        missing = [recipe for recipe in recipes if recipe.pk not in fragments]
+        if missing:
+            prefetch_related_objects(missing, *recipe_related_lookups())
+            built = {
+                recipe.pk: self.get_fragment(recipe) for recipe in missing
+            }
+            # Not caching recipes whose image variants are still being made,
+            # the worker may finish before this request stores them.
+            set_recipe_fragments(
+                {
+                    recipe.pk: built[recipe.pk]
+                    for recipe in missing
+                    if recipe.image_variants_source == recipe.image.name
+                },
+                stamp,
+            )
+            fragments.update(built)
+        return [
+            self.add_user_flags(
+                self.with_image(fragments[recipe.pk], image_variant), recipe
+            )
+            for recipe in recipes
+        ]
+
+    @staticmethod
+    def with_image(fragment, variant):
+        """The fragment showing the JPEG variant of the image."""
+        urls = fragment.get("images", {}).get(variant)
+        if not urls:
+            return fragment
+        return {**fragment, "image": urls["jpeg"]}
+
+    def get_fragment(self, recipe):
+        """The representation of the recipe without the per-user flags."""
+        fragment = super().to_representation(recipe)
+        fragment["is_favorited"] = False
+        fragment["is_in_shopping_cart"] = False
+        fragment["author"] = {**fragment["author"], "is_subscribed": False}
+        return fragment
+
+    def get_images(self, recipe):
+        """Image variant URLs by size and format, empty until they are made."""
+        media_url = get_media_url(self.context.get("request"))
+        return {
+            variant: {
+                image_format: image_url(name, media_url)
+                for image_format, name in formats.items()
+            }
+            for variant, formats in recipe.image_variants.items()
+        }
+
+    def add_user_flags(self, fragment, recipe):
+        data = dict(fragment)
+        data["is_favorited"] = self.get_is_favorited(recipe)
+        data["is_in_shopping_cart"] = self.get_is_in_shopping_cart(recipe)
+        data["author"] = {
+            **fragment["author"],
+            "is_subscribed": self.get_is_subscribed(recipe),
+        }
+        return data
+
+    def get_is_subscribed(self, obj):
+        """Check whether the user follows the author of the recipe."""
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
+        request = self.context.get("request")
+        if not request or request.user.is_anonymous:
+            return False
+        return Follow.objects.filter(
+            user=request.user, author=obj.author_id
+        ).exists()
+
+    def get_author(self, obj):
+        """The author, with the subscription flag annotated on the recipe."""
+        author = obj.author
+        if hasattr(obj, "is_subscribed"):
+            author.is_subscribed = obj.is_subscribed
+        return CustomUserSerializer(author, context=self.context).data
 
     @staticmethod
     def get_ingredients(obj):
         """We get the ingredients from the RecipeIngredient model."""
-        ingredients = RecipeIngredient.objects.filter(recipe=obj)
+        ingredients = obj.recipe_ingredient.all()
         return ShowIngredientsInRecipeSerializer(ingredients, many=True).data
 
     def get_is_favorited(self, obj):
         """Check whether the recipe is in the favorites."""
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
         request = self.context.get("request")
         if not request or request.user.is_anonymous:
             return False
@@ -201,6 +440,8 @@ class ShowRecipeSerializer(serializers.ModelSerializer):
 
     def get_is_in_shopping_cart(self, obj):
         """We check whether the recipe is in the shopping cart."""
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
         request = self.context.get("request")
         if not request or request.user.is_anonymous:
             return False
@@ -225,7 +466,7 @@ class FavoriteRecipeSerializer(serializers.ModelSerializer):
             UniqueTogetherValidator(
                 queryset=FavoriteRecipe.objects.all(),
                 fields=("user", "recipe"),
-                message="Рецепт уже в избранном",
+                message=FAVORITE_EXISTS_MESSAGE,
             )
         ]
 
@@ -245,6 +486,6 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
             UniqueTogetherValidator(
                 queryset=ShoppingCart.objects.all(),
                 fields=("user", "recipe"),
-                message="Рецепт уже в списке покупок",
+                message=SHOPPING_CART_EXISTS_MESSAGE,
             )
         ]
@@ -1,20 +1,493 @@
+import csv
+import hashlib
+import io
+from collections import defaultdict
+from datetime import timedelta
+
 from django.conf import settings
-from django.http import HttpResponse
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.negotiation import DefaultContentNegotiation
+
+from users.models import Follow, User
+
+from .cache import bump_shared_cache_versions
+from .models import (
+    FavoriteRecipe,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingCartIngredient,
+)
+
+CART_FOOTER = "Приятных покупок!"
+
+# Additions older than this many half-lives weigh less than 0.1% of a new
+# one, the trending score leaves them out.
+TRENDING_HALF_LIVES = 10
+
+
+class ShoppingCartExporter:
+    """Base class of the shopping cart file formats."""
+
+    content_type = None
+    extension = None
+
+    def __init__(self, cart_ingredients):
+        self.cart_ingredients = cart_ingredients
+
+    def rows(self):
+        """Yield (name, amount, measurement unit) without caching rows."""
+        for ing in self.cart_ingredients.iterator():
+            yield (
+                ing["ingredient__name"],
+                ing["ingredient_total_amount"],
+                ing["ingredient__measurement_unit"],
+            )
+
+    def stream(self):
+        """Yield the file contents in chunks."""
+        raise NotImplementedError
+
+
+class TextExporter(ShoppingCartExporter):
+    """Plain text shopping list, one ingredient per line."""
+
+    content_type = "text/plain; charset=utf-8"
+    extension = "txt"
+
+    def stream(self):
+        for name, amount, measurement_unit in self.rows():
+            yield f"{name}: {amount} {measurement_unit}\n"
+        yield f"\n{CART_FOOTER}"
+
+
+class CsvExporter(ShoppingCartExporter):
+    """CSV shopping list with a header row."""
+
+    content_type = "text/csv; charset=utf-8"
+    extension = "csv"
+
+    def stream(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(("name", "amount", "measurement_unit"))
+        for row in self.rows():
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
 
+class PdfExporter(ShoppingCartExporter):
+    """PDF shopping list.
 
-def convert_to_file(cart_ingredients):
+    A PDF document can only be written out as a whole, so the pages are
+    rendered into memory and sent as a single chunk.
+    """
+
+    content_type = "application/pdf"
+    extension = "pdf"
+    font_name = "ShoppingCartFont"
+    font_size = 12
+    margin = 50
+
+    def stream(self):
+        if self.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_CART_PDF_FONT)
+            )
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        _, height = A4
+        line_height = self.font_size * 1.5
+        pdf.setFont(self.font_name, self.font_size)
+        y = height - self.margin
+        lines = (
+            f"{name}: {amount} {measurement_unit}"
+            for name, amount, measurement_unit in self.rows()
+        )
+        for line in (*lines, "", CART_FOOTER):
+            if y < self.margin:
+                pdf.showPage()
+                pdf.setFont(self.font_name, self.font_size)
+                y = height - self.margin
+            pdf.drawString(self.margin, y, line)
+            y -= line_height
+        pdf.save()
+        yield buffer.getvalue()
+
+
+EXPORTERS = {
+    exporter.extension: exporter
+    for exporter in (TextExporter, CsvExporter, PdfExporter)
+}
+
+
+class ShoppingCartNegotiation(DefaultContentNegotiation):
+    """Leave the ``format`` query parameter to the shopping cart exporters.
+
+    DRF treats ``?format=`` as a renderer override and answers 404 for
+    formats it has no renderer for, so errors are always rendered with the
+    first renderer of the view.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+def get_cart_etag(user, file_format):
+    """An ETag that changes whenever the user's shopping list changes.
+
+    A hash of the rows the list is made of, names and units included, so
+    renamed ingredients change it too.
+    """
+    digest = hashlib.md5(f"{user.pk}:{file_format}".encode())
+    rows = get_cart_ingredients(user).values_list(
+        "ingredient_id",
+        "total_amount",
+        "ingredient__name",
+        "ingredient__measurement_unit",
+    )
+    for row in rows.iterator():
+        digest.update(repr(row).encode())
+    return digest.hexdigest()
+
+
+def convert_to_file(cart_ingredients, file_format="txt", etag=None):
     """A function for generating a shopping cart."""
-    shopping_cart = []
-    for ing in cart_ingredients:
-        name = ing["ingredient__name"]
-        measurement_unit = ing["ingredient__measurement_unit"]
-        amount = ing["ingredient_total_amount"]
-        shopping_cart.append(f"{name}: {amount} {measurement_unit}")
-    shopping_cart.append("\nПриятных покупок!")
-    content = "\n".join(shopping_cart)
-    content_type = "text/plain,charset=utf8"
-    response = HttpResponse(content, content_type=content_type)
-    response[
-        "Content-Disposition"
-    ] = f"attachment; filename={settings.DOWNLOADING_CART_NAME}"
+    exporter = EXPORTERS[file_format](cart_ingredients)
+    response = StreamingHttpResponse(
+        exporter.stream(), content_type=exporter.content_type
+    )
+    filename = f"{settings.DOWNLOADING_CART_NAME}.{exporter.extension}"
+    response["Content-Disposition"] = f"attachment; filename={filename}"
+    if etag is not None:
+        response["ETag"] = f'"{etag}"'
     return response
+
+
+def get_cart_ingredients(user):
+    """The user's shopping list read from the precomputed totals."""
+    return (
+        ShoppingCartIngredient.objects.filter(user=user)
+        .order_by("ingredient__name")
+        .values(
+            "ingredient__name",
+            "ingredient__measurement_unit",
+            ingredient_total_amount=F("total_amount"),
+        )
+    )
+
+
+def insert_ignoring_conflicts(model, **values):
+    """Insert a row unless it breaks a unique constraint.
+
+    A single ``INSERT ... ON CONFLICT DO NOTHING`` (``INSERT OR IGNORE`` on
+    SQLite), so concurrent inserts of the same row never fail. The values
+    are keyed by column attribute names, the other fields get their
+    defaults. Returns whether the row was created.
+    """
+    opts = model._meta
+    values = {
+        **{
+            field.attname: field.get_default()
+            for field in opts.concrete_fields
+            if field.has_default()
+        },
+        **values,
+    }
+    quote = connection.ops.quote_name
+    fields = [opts.get_field(name) for name in values]
+    sql = (
+        f"{connection.ops.insert_statement(ignore_conflicts=True)} "
+        f"{quote(opts.db_table)} "
+        f"({', '.join(quote(field.column) for field in fields)}) "
+        f"VALUES ({', '.join(['%s'] * len(fields))}) "
+        f"{connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql,
+            [
+                field.get_db_prep_save(value, connection)
+                for field, value in zip(fields, values.values())
+            ],
+        )
+        return cursor.rowcount == 1
+
+
+def lock_cart_totals(users):
+    """Lock the users' rows, so their totals are changed one at a time.
+
+    Locking the totals themselves is not enough: the missing ones cannot
+    be locked, and two requests would insert the same total. Take it
+    before changing the carts too, in the transaction that updates the
+    totals, so they follow the carts in the order they were changed.
+    """
+    list(
+        User.objects.select_for_update()
+        .filter(pk__in=[getattr(user, "pk", user) for user in users])
+        .order_by("pk")
+        .values_list("pk")
+    )
+
+
+def _change_cart_totals(user, recipe, sign):
+    """Add (sign=1) or subtract (sign=-1) the recipe from the user's totals."""
+    amounts = dict(
+        RecipeIngredient.objects.filter(recipe=recipe).values_list(
+            "ingredient_id", "amount"
+        )
+    )
+    with transaction.atomic():
+        lock_cart_totals([user])
+        totals = list(
+            ShoppingCartIngredient.objects.filter(
+                user=user, ingredient_id__in=amounts
+            )
+        )
+        for total in totals:
+            total.total_amount += sign * amounts.pop(total.ingredient_id)
+        ShoppingCartIngredient.objects.filter(
+            pk__in=[total.pk for total in totals if total.total_amount <= 0]
+        ).delete()
+        ShoppingCartIngredient.objects.bulk_update(
+            [total for total in totals if total.total_amount > 0],
+            ["total_amount"],
+        )
+        if sign > 0:
+            ShoppingCartIngredient.objects.bulk_create(
+                ShoppingCartIngredient(
+                    user=user, ingredient_id=ingredient_id, total_amount=amount
+                )
+                for ingredient_id, amount in amounts.items()
+            )
+
+
+def add_to_cart_totals(user, recipe):
+    """Add the ingredients of a recipe put into the shopping cart."""
+    _change_cart_totals(user, recipe, 1)
+
+
+def remove_from_cart_totals(user, recipe):
+    """Subtract the ingredients of a recipe removed from the shopping cart."""
+    _change_cart_totals(user, recipe, -1)
+
+
+def calculate_cart_totals(users=None, ingredients=None):
+    """Shopping list totals computed from the carts themselves.
+
+    Returns a dict of ``(user_id, ingredient_id) -> total_amount``.
+    """
+    lookups = {"recipe__recipe_ingredient__isnull": False}
+    if users is not None:
+        lookups["user__in"] = users
+    if ingredients is not None:
+        lookups["recipe__recipe_ingredient__ingredient__in"] = ingredients
+    # A single filter() call: each one joins the multi-valued relation
+    # anew, and the amounts would be counted once per extra join.
+    cart_ingredients = (
+        ShoppingCart.objects.filter(**lookups)
+        .values("user", "recipe__recipe_ingredient__ingredient")
+        .annotate(total_amount=Sum("recipe__recipe_ingredient__amount"))
+        .order_by()
+    )
+    return {
+        (row["user"], row["recipe__recipe_ingredient__ingredient"]): row[
+            "total_amount"
+        ]
+        for row in cart_ingredients.iterator()
+    }
+
+
+def rebuild_cart_totals(users=None, ingredients=None, batch_size=1000):
+    """Recompute the shopping list totals of the users (all by default).
+
+    ``ingredients`` limits the rebuild to the totals of these ingredients.
+    """
+    stored = ShoppingCartIngredient.objects.all()
+    if users is not None:
+        stored = stored.filter(user__in=users)
+    if ingredients is not None:
+        stored = stored.filter(ingredient__in=ingredients)
+    with transaction.atomic():
+        if users is not None:
+            lock_cart_totals(users)
+        totals = calculate_cart_totals(users, ingredients)
+        stored.delete()
+        ShoppingCartIngredient.objects.bulk_create(
+            (
+                ShoppingCartIngredient(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=total_amount,
+                )
+                for (user_id, ingredient_id), total_amount in totals.items()
+            ),
+            batch_size=batch_size,
+        )
+    return len(totals)
+
+
+def check_cart_totals():
+    """Keys of the stored totals that differ from the carts."""
+    expected = calculate_cart_totals()
+    stored = {
+        (user_id, ingredient_id): total_amount
+        for user_id, ingredient_id, total_amount in (
+            ShoppingCartIngredient.objects.values_list(
+                "user_id", "ingredient_id", "total_amount"
+            ).iterator()
+        )
+    }
+    return sorted(
+        key
+        for key in expected.keys() | stored.keys()
+        if expected.get(key) != stored.get(key)
+    )
+
+
+COUNTERS = (
+    (Recipe, "favorites_count", FavoriteRecipe, "recipe"),
+    (Recipe, "in_carts_count", ShoppingCart, "recipe"),
+    (User, "recipes_count", Recipe, "author"),
+    (User, "followers_count", Follow, "author"),
+)
+
+
+def change_counter(queryset, field, delta):
+    """Atomically add delta to a denormalized counter, never below zero."""
+    queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def _count(related_model, related_field):
+    """The number of related rows of the outer row, as an expression."""
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(**{related_field: OuterRef("pk")})
+            .order_by()
+            .values(related_field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def _stale_counters():
+    """Rows whose counters differ from the related rows, with the counts."""
+    for model, field, related_model, related_field in COUNTERS:
+        count = _count(related_model, related_field)
+        yield field, count, model.objects.exclude(**{field: count})
+
+
+def set_counter(queryset, field):
+    """Set a denormalized counter of the rows from their related rows.
+
+    Meant for changes whose size is not known, like inserts ignoring
+    conflicts. Call it in a transaction: the rows are locked first, in
+    primary key order, so the counts include the changes of the concurrent
+    requests waited for.
+    """
+    related_model, related_field = next(
+        (related_model, related_field)
+        for model, counter, related_model, related_field in COUNTERS
+        if model is queryset.model and counter == field
+    )
+    list(queryset.select_for_update().order_by("pk").values_list("pk"))
+    queryset.update(**{field: _count(related_model, related_field)})
+
+
+def recount_counters():
+    """Recompute the stale counters, return the changed rows by counter."""
+    return {
+        field: stale.update(**{field: count})
+        for field, count, stale in _stale_counters()
+    }
+
+
+def check_counters():
+    """The number of stale rows by counter."""
+    return {field: stale.count() for field, _, stale in _stale_counters()}
+
+
+def _trending_scores(now, batch_size):
+    """Recipe pk -> its favorites and cart additions, each decayed by age.
+
+    Every addition counts 1, halved every ``RECIPE_TRENDING_HALF_LIFE``
+    seconds since it was made; the ones older than
+    ``TRENDING_HALF_LIVES`` half-lives are left out.
+    """
+    half_life = settings.RECIPE_TRENDING_HALF_LIFE
+    since = now - timedelta(seconds=half_life * TRENDING_HALF_LIVES)
+    scores = defaultdict(float)
+    for model in (FavoriteRecipe, ShoppingCart):
+        additions = (
+            model.objects.filter(created__gte=since)
+            .order_by()
+            .values_list("recipe_id", "created")
+        )
+        for recipe_id, created in additions.iterator(chunk_size=batch_size):
+            age = max((now - created).total_seconds(), 0)
+            scores[recipe_id] += 0.5 ** (age / half_life)
+    return scores
+
+
+def update_recipe_scores(now=None, batch_size=1000):
+    """Recompute the popular and trending scores of every recipe.
+
+    The popular score is the number of favorites and cart additions, the
+    trending score the same additions decayed by their age, so a recipe
+    trends while it is being added, however old it is. Returns the number
+    of updated recipes.
+    """
+    now = now or timezone.now()
+    trending = _trending_scores(now, batch_size)
+    recipes = Recipe.objects.only(
+        "favorites_count",
+        "in_carts_count",
+        "popular_score",
+        "trending_score",
+    ).order_by("pk")
+    changed = []
+    updated = 0
+    for recipe in recipes.iterator(chunk_size=batch_size):
+        popular_score = recipe.favorites_count + recipe.in_carts_count
+        trending_score = trending.get(recipe.pk, 0)
+        if (recipe.popular_score, recipe.trending_score) == (
+            popular_score,
+            trending_score,
+        ):
+            continue
+        recipe.popular_score = popular_score
+        recipe.trending_score = trending_score
+        changed.append(recipe)
+        if len(changed) == batch_size:
+            Recipe.objects.bulk_update(
+                changed, ["popular_score", "trending_score"]
+            )
+            updated += len(changed)
+            changed = []
+    Recipe.objects.bulk_update(changed, ["popular_score", "trending_score"])
+    return updated + len(changed)
+
+
+def rebuild_derived_data():
+    """Recompute what signals keep up to date, after loading rows in bulk.
+
+    Returns whether the cached tags and ingredients of the server could be
+    invalidated, see ``bump_shared_cache_versions``.
+    """
+    recount_counters()
+    rebuild_cart_totals()
+    update_recipe_scores()
+    return bump_shared_cache_versions("tags", "ingredients")
@@ -0,0 +1,84 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from users.models import User
+
+from .cache import bump_cache_version, invalidate_recipe_fragments
+from .images import schedule_recipe_image
+from .models import Ingredient, Recipe, RecipeIngredient
+from .search import invalidate_ingredient_index
+from .services import rebuild_cart_totals
+
+# Sent once by a recipe update with the ids of the added, removed and
+# re-measured ingredients, arguments: recipe, ingredient_ids.
+recipe_ingredients_changed = Signal()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    """Drop the cached ingredients after any change."""
+    transaction.on_commit(invalidate_ingredient_index)
+    transaction.on_commit(lambda: bump_cache_version("ingredients"))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    pks = [instance.pk]
+    transaction.on_commit(lambda: invalidate_recipe_fragments(pks))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, **kwargs):
+    """Make the image variants in the background after a new photo."""
+    if not instance.image or instance.image.name == (
+        instance.image_variants_source
+    ):
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: schedule_recipe_image(pk))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    pks = [instance.recipe_id]
+    transaction.on_commit(lambda: invalidate_recipe_fragments(pks))
+
+
+@receiver(recipe_ingredients_changed, sender=Recipe)
+def update_cart_totals(sender, recipe, ingredient_ids, **kwargs):
+    """Rebuild the changed ingredients in the carts holding the recipe."""
+    rebuild_cart_totals(
+        User.objects.filter(shopping_cart__recipe=recipe), ingredient_ids
+    )
+    pks = [recipe.pk]
+    transaction.on_commit(lambda: invalidate_recipe_fragments(pks))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if not action.startswith("post_"):
+            return
+        pks = [instance.pk]
+    elif action == "pre_clear":
+        pks = list(instance.recipes.values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove"):
+        pks = list(pk_set)
+    else:
+        return
+    transaction.on_commit(lambda: invalidate_recipe_fragments(pks))
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    """Drop the recipes of a user whose profile has changed."""
+    if created or (
+        update_fields is not None and set(update_fields) <= {"last_login"}
+    ):
+        return
+    pks = list(instance.recipes.values_list("pk", flat=True))
+    transaction.on_commit(lambda: invalidate_recipe_fragments(pks))
@@ -0,0 +1,896 @@
+import base64
+import io
+import json
+import tempfile
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import skipIf
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+    force_authenticate,
+)
+
+from backend.pagination import LimitPageNumberPaginator, RecipePagination
+from backend.querycount import SIZES, assert_constant_queries
+from tags.models import Tag
+from users.models import Follow, User
+
+from .cache import (
+    bump_cache_version,
+    bump_shared_cache_versions,
+    get_cache_version,
+)
+from .management.commands import check_query_counts
+from .management.commands.check_query_plans import (
+    get_checks,
+    get_missing_indexes,
+    prefer_indexes,
+)
+from .models import (
+    FavoriteRecipe,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingCartIngredient,
+)
+from .search import get_ingredient_index, invalidate_ingredient_index
+from .serializers import (
+    FAVORITE_EXISTS_MESSAGE,
+    SHOPPING_CART_EXISTS_MESSAGE,
+)
+from .services import (
+    calculate_cart_totals,
+    check_cart_totals,
+    check_counters,
+    get_cart_etag,
+    rebuild_cart_totals,
+    recount_counters,
+    update_recipe_scores,
+)
+from .views import RecipeViewSet
+
+IMAGE = "recipes/test.jpg"
+
+
+def create_user(username):
+    return User.objects.create(username=username, email=f"{username}@ex.com")
+
+
+def create_recipe(author, ingredients, name="Рецепт"):
+    """A recipe with the given {ingredient: amount}."""
+    recipe = Recipe.objects.create(
+        author=author,
+        name=name,
+        text=name,
+        cooking_time=1,
+        image=IMAGE,
+        # Marks the variants as made, so no image job is scheduled.
+        image_variants_source=IMAGE,
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient, amount in ingredients.items()
+    )
+    return recipe
+
+
+def run_concurrently(func, count):
+    """Call func from count threads released at once, return the results."""
+    barrier = threading.Barrier(count)
+
+    def run(_):
+        try:
+            barrier.wait()
+            return func()
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(count) as pool:
+        return list(pool.map(run, range(count)))
+
+
+class CartTotalsTest(TestCase):
+    """Shopping list totals of a recipe held in several carts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.first = create_user("first")
+        cls.second = create_user("second")
+        cls.flour = Ingredient.objects.create(
+            name="мука", measurement_unit="г"
+        )
+        cls.sugar = Ingredient.objects.create(
+            name="сахар", measurement_unit="г"
+        )
+        cls.tag = Tag.objects.create(name="Обед", color="#00ff00", slug="obed")
+        cls.recipe = create_recipe(
+            cls.first, {cls.flour: 10, cls.sugar: 5}
+        )
+        cls.recipe.tags.add(cls.tag)
+        ShoppingCart.objects.create(user=cls.first, recipe=cls.recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_scoped_totals_count_each_cart_once(self):
+        ShoppingCart.objects.create(user=self.second, recipe=self.recipe)
+        self.assertEqual(
+            calculate_cart_totals([self.first]),
+            {
+                (self.first.pk, self.flour.pk): 10,
+                (self.first.pk, self.sugar.pk): 5,
+            },
+        )
+        self.assertEqual(
+            calculate_cart_totals([self.first], [self.flour]),
+            {(self.first.pk, self.flour.pk): 10},
+        )
+        self.assertEqual(
+            calculate_cart_totals(),
+            {
+                (self.first.pk, self.flour.pk): 10,
+                (self.first.pk, self.sugar.pk): 5,
+                (self.second.pk, self.flour.pk): 10,
+                (self.second.pk, self.sugar.pk): 5,
+            },
+        )
+
+    def test_bulk_add_to_shared_recipe(self):
+        rebuild_cart_totals()
+        self.client.force_authenticate(self.second)
+        response = self.client.post(
+            "/api/recipes/shopping_cart/",
+            {"recipes": [self.recipe.pk]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get("/api/recipes/download_shopping_cart/")
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn("мука: 10 г", content)
+        self.assertEqual(check_cart_totals(), [])
+
+    def test_update_of_shared_recipe(self):
+        ShoppingCart.objects.create(user=self.second, recipe=self.recipe)
+        rebuild_cart_totals()
+        self.client.force_authenticate(self.first)
+        response = self.client.patch(
+            f"/api/recipes/{self.recipe.pk}/",
+            {
+                "name": self.recipe.name,
+                "text": self.recipe.text,
+                "cooking_time": 1,
+                "tags": [self.tag.pk],
+                "ingredients": [
+                    {"id": self.flour.pk, "amount": 11},
+                    {"id": self.sugar.pk, "amount": 5},
+                ],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            set(
+                ShoppingCartIngredient.objects.filter(
+                    ingredient=self.flour
+                ).values_list("user", "total_amount")
+            ),
+            {(self.first.pk, 11), (self.second.pk, 11)},
+        )
+        self.assertEqual(check_cart_totals(), [])
+
+
+class AddRecipeTest(TestCase):
+    """Adding a recipe to favorites or the cart answers with the recipe."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("user")
+        flour = Ingredient.objects.create(name="мука", measurement_unit="г")
+        cls.recipe = create_recipe(cls.user, {flour: 10})
+
+    def test_add_twice(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for path, message in (
+            ("favorite", FAVORITE_EXISTS_MESSAGE),
+            ("shopping_cart", SHOPPING_CART_EXISTS_MESSAGE),
+        ):
+            with self.subTest(path):
+                url = f"/api/recipes/{self.recipe.pk}/{path}/"
+                response = client.post(url)
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(
+                    set(response.data), {"id", "name", "image", "cooking_time"}
+                )
+                self.assertEqual(response.data["id"], self.recipe.pk)
+                response = client.post(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data, {"errors": message})
+
+
+class RecipeScoresTest(TestCase):
+    """The trending score decays each addition by its own age."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user("author")
+        cls.users = [create_user(f"user{number}") for number in range(3)]
+        flour = Ingredient.objects.create(name="мука", measurement_unit="г")
+        cls.old, cls.new = (
+            create_recipe(cls.author, {flour: 10}) for _ in range(2)
+        )
+
+    def test_scores(self):
+        now = timezone.now()
+        half_life = timedelta(seconds=settings.RECIPE_TRENDING_HALF_LIFE)
+        Recipe.objects.filter(pk=self.old.pk).update(
+            pub_date=now - 50 * half_life
+        )
+        for user in self.users:
+            FavoriteRecipe.objects.create(user=user, recipe=self.old)
+            ShoppingCart.objects.create(
+                user=user, recipe=self.new, created=now - half_life
+            )
+        # Too old to count at all.
+        FavoriteRecipe.objects.create(
+            user=self.author, recipe=self.new, created=now - 20 * half_life
+        )
+        recount_counters()
+        update_recipe_scores(now)
+        self.old.refresh_from_db()
+        self.new.refresh_from_db()
+        self.assertEqual(
+            (self.old.popular_score, self.new.popular_score), (3, 4)
+        )
+        self.assertAlmostEqual(self.old.trending_score, 3, places=3)
+        self.assertAlmostEqual(self.new.trending_score, 1.5)
+
+    def test_added_through_api(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        before = timezone.now()
+        for path, model in (
+            ("favorite", FavoriteRecipe),
+            ("shopping_cart", ShoppingCart),
+        ):
+            with self.subTest(path):
+                response = client.post(f"/api/recipes/{self.new.pk}/{path}/")
+                self.assertEqual(response.status_code, 201)
+                created = model.objects.get(recipe=self.new).created
+                self.assertTrue(before <= created <= timezone.now())
+
+
+class CartEtagTest(TestCase):
+    """The shopping list ETag follows every change of the list."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("user")
+        cls.first, cls.second = (
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("мука", "сахар")
+        )
+
+    def etag_of(self, first_amount, second_amount):
+        ShoppingCartIngredient.objects.all().delete()
+        ShoppingCartIngredient.objects.bulk_create(
+            ShoppingCartIngredient(
+                user=self.user, ingredient=ingredient, total_amount=amount
+            )
+            for ingredient, amount in (
+                (self.first, first_amount),
+                (self.second, second_amount),
+            )
+        )
+        return get_cart_etag(self.user, "txt")
+
+    def test_amounts(self):
+        # Lists that sum to the same ids and id-weighted amounts.
+        self.assertNotEqual(
+            self.etag_of(1, self.first.pk + 1),
+            self.etag_of(self.second.pk + 1, 1),
+        )
+        self.assertEqual(self.etag_of(1, 2), self.etag_of(1, 2))
+
+    def test_renamed_ingredient(self):
+        etag = self.etag_of(1, 2)
+        Ingredient.objects.filter(pk=self.first.pk).update(name="мука в/с")
+        self.assertNotEqual(get_cart_etag(self.user, "txt"), etag)
+
+    def test_format(self):
+        self.etag_of(1, 2)
+        self.assertNotEqual(
+            get_cart_etag(self.user, "txt"), get_cart_etag(self.user, "csv")
+        )
+
+
+class BulkCountersTest(TestCase):
+    """Counters after adding and removing lists of recipes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("user")
+        flour = Ingredient.objects.create(name="мука", measurement_unit="г")
+        cls.recipes = [
+            create_recipe(cls.user, {flour: amount}) for amount in (1, 2)
+        ]
+        FavoriteRecipe.objects.create(user=cls.user, recipe=cls.recipes[0])
+        recount_counters()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def request(self, method, path):
+        return getattr(self.client, method)(
+            path,
+            {"recipes": [recipe.pk for recipe in self.recipes]},
+            format="json",
+        )
+
+    def counts(self, field):
+        return list(
+            Recipe.objects.order_by("pk").values_list(field, flat=True)
+        )
+
+    def test_add_and_remove(self):
+        for path, field in (
+            ("/api/recipes/favorite/", "favorites_count"),
+            ("/api/recipes/shopping_cart/", "in_carts_count"),
+        ):
+            with self.subTest(path):
+                self.assertEqual(self.request("post", path).status_code, 201)
+                self.assertEqual(self.counts(field), [1, 1])
+                self.assertEqual(self.request("post", path).status_code, 201)
+                self.assertEqual(self.counts(field), [1, 1])
+                self.assertEqual(
+                    self.request("delete", path).status_code, 204
+                )
+                self.assertEqual(self.counts(field), [0, 0])
+        self.assertEqual(set(check_counters().values()), {0})
+
+    def test_counters_follow_the_rows(self):
+        # A row added by a concurrent request the list did not expect.
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(
+            favorites_count=0
+        )
+        self.request("post", "/api/recipes/favorite/")
+        self.assertEqual(self.counts("favorites_count"), [1, 1])
+
+
+class SharedCacheVersionTest(SimpleTestCase):
+    """Commands only bump the versions the server can see."""
+
+    def bump(self):
+        version = get_cache_version("ingredients")
+        bumped = bump_shared_cache_versions("ingredients")
+        return bumped, get_cache_version("ingredients") != version
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+            }
+        }
+    )
+    def test_process_cache(self):
+        self.assertEqual(self.bump(), (False, False))
+
+    def test_shared_cache(self):
+        with tempfile.TemporaryDirectory() as location:
+            with override_settings(
+                CACHES={
+                    "default": {
+                        "BACKEND": "django.core.cache.backends.filebased."
+                        "FileBasedCache",
+                        "LOCATION": location,
+                    }
+                }
+            ):
+                self.assertEqual(self.bump(), (True, True))
+
+
+class IngredientIndexTest(TestCase):
+    """The in-memory index catches up with changes of other processes."""
+
+    def setUp(self):
+        invalidate_ingredient_index()
+        Ingredient.objects.create(name="мука", measurement_unit="г")
+
+    def add_unseen(self):
+        # As from another process: no signal reaches this one.
+        Ingredient.objects.bulk_create(
+            [Ingredient(name="мускат", measurement_unit="г")]
+        )
+
+    def names(self):
+        items = get_ingredient_index().search("му", 5)
+        return [item["name"] for item in items]
+
+    def test_version_change(self):
+        self.assertEqual(self.names(), ["мука"])
+        self.add_unseen()
+        self.assertEqual(self.names(), ["мука"])
+        bump_cache_version("ingredients")
+        self.assertEqual(self.names(), ["мука", "мускат"])
+
+    def test_expiry(self):
+        self.assertEqual(self.names(), ["мука"])
+        self.add_unseen()
+        with override_settings(API_CACHE_TIMEOUT=0):
+            self.assertEqual(self.names(), ["мука", "мускат"])
+
+
+@skipIf(
+    connection.vendor == "sqlite",
+    "SQLite fails concurrent writers of the test database, needs PostgreSQL",
+)
+class ConcurrentAddTest(TransactionTestCase):
+    """Double clicks: the same row posted by several requests at once."""
+
+    threads = 8
+
+    def setUp(self):
+        self.user = create_user("user")
+        self.flour, self.sugar = (
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("мука", "сахар")
+        )
+        self.recipe = create_recipe(
+            self.user, {self.flour: 10, self.sugar: 5}
+        )
+
+    def post_at_once(self, path, data=None):
+        def post():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            return client.post(path, data, format="json").status_code
+
+        return sorted(run_concurrently(post, self.threads))
+
+    def test_favorite(self):
+        statuses = self.post_at_once(
+            f"/api/recipes/{self.recipe.pk}/favorite/"
+        )
+        self.assertEqual(statuses, [201] + [400] * (self.threads - 1))
+        self.assertEqual(FavoriteRecipe.objects.count(), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_shopping_cart(self):
+        statuses = self.post_at_once(
+            f"/api/recipes/{self.recipe.pk}/shopping_cart/"
+        )
+        self.assertEqual(statuses, [201] + [400] * (self.threads - 1))
+        self.assertEqual(ShoppingCart.objects.count(), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.in_carts_count, 1)
+        self.assertEqual(
+            dict(
+                ShoppingCartIngredient.objects.values_list(
+                    "ingredient", "total_amount"
+                )
+            ),
+            {self.flour.pk: 10, self.sugar.pk: 5},
+        )
+
+    def test_bulk(self):
+        for path, field in (
+            ("/api/recipes/favorite/", "favorites_count"),
+            ("/api/recipes/shopping_cart/", "in_carts_count"),
+        ):
+            with self.subTest(path):
+                statuses = self.post_at_once(
+                    path, {"recipes": [self.recipe.pk]}
+                )
+                self.assertEqual(statuses, [201] * self.threads)
+                self.recipe.refresh_from_db()
+                self.assertEqual(getattr(self.recipe, field), 1)
+        self.assertEqual(check_cart_totals(), [])
+
+    def test_add_and_remove(self):
+        path = f"/api/recipes/{self.recipe.pk}/shopping_cart/"
+        methods = iter(["post", "delete"] * (self.threads // 2) * 10)
+        lock = threading.Lock()
+
+        def toggle():
+            with lock:
+                method = next(methods)
+            client = APIClient()
+            client.force_authenticate(self.user)
+            return getattr(client, method)(path).status_code
+
+        for _ in range(10):
+            run_concurrently(toggle, self.threads)
+            self.assertEqual(check_cart_totals(), [])
+            self.assertEqual(check_counters()["in_carts_count"], 0)
+
+    def test_delete_recipe_put_into_carts(self):
+        users = [create_user(f"user{number}") for number in range(3)]
+        clients = iter(users + [self.user])
+        lock = threading.Lock()
+
+        def request():
+            with lock:
+                user = next(clients)
+            client = APIClient()
+            client.force_authenticate(user)
+            if user == self.user:
+                path = f"/api/recipes/{self.recipe.pk}/"
+                return client.delete(path).status_code
+            path = f"/api/recipes/{self.recipe.pk}/shopping_cart/"
+            return client.post(path).status_code
+
+        statuses = run_concurrently(request, len(users) + 1)
+        self.assertIn(204, statuses)
+        self.assertFalse(ShoppingCart.objects.exists())
+        self.assertEqual(check_cart_totals(), [])
+
+    def test_unsubscribe(self):
+        author = create_user("author")
+        Follow.objects.create(user=self.user, author=author)
+        Follow.objects.create(user=create_user("other"), author=author)
+        User.objects.filter(pk=author.pk).update(followers_count=2)
+
+        def unsubscribe():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            return client.delete(
+                f"/api/users/{author.pk}/subscribe/"
+            ).status_code
+
+        statuses = sorted(run_concurrently(unsubscribe, self.threads))
+        self.assertEqual(statuses, [204] + [404] * (self.threads - 1))
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 1)
+
+    def test_recipes_sharing_ingredients(self):
+        recipes = [self.recipe] + [
+            create_recipe(self.user, {self.flour: 10, self.sugar: 5})
+            for _ in range(self.threads - 1)
+        ]
+        paths = iter(
+            f"/api/recipes/{recipe.pk}/shopping_cart/" for recipe in recipes
+        )
+        lock = threading.Lock()
+
+        def post():
+            with lock:
+                path = next(paths)
+            client = APIClient()
+            client.force_authenticate(self.user)
+            return client.post(path).status_code
+
+        statuses = run_concurrently(post, self.threads)
+        self.assertEqual(statuses, [201] * self.threads)
+        self.assertEqual(
+            dict(
+                ShoppingCartIngredient.objects.values_list(
+                    "ingredient", "total_amount"
+                )
+            ),
+            {
+                self.flour.pk: 10 * self.threads,
+                self.sugar.pk: 5 * self.threads,
+            },
+        )
+
+
+class QueryPlanTest(TestCase):
+    """The main API queries are planned with their indexes."""
+
+    def test_indexes(self):
+        prefer_indexes()
+        for name, queryset, index_groups in get_checks():
+            with self.subTest(name):
+                plan, missing = get_missing_indexes(queryset, index_groups)
+                self.assertEqual(missing, [], plan)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": check_query_counts.PREFIX,
+        }
+    }
+)
+class QueryCountTest(TestCase):
+    """The main endpoints run a constant number of queries, in budget."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = check_query_counts.Data(max(SIZES))
+
+    def test_query_counts(self):
+        client = APIClient()
+        client.force_authenticate(self.data.user)
+        for name, func, setup in check_query_counts.get_checks(
+            client, self.data
+        ):
+            with self.subTest(name):
+                assert_constant_queries(
+                    func,
+                    limit=check_query_counts.BUDGETS[name],
+                    setup=setup,
+                )
+
+
+class PaginationTest(SimpleTestCase):
+    """``?limit=`` cannot ask for pages over the maximum size."""
+
+    def test_max_page_size(self):
+        for paginator in (LimitPageNumberPaginator(), RecipePagination()):
+            for limit, expected in (
+                (10, 10),
+                (100000, settings.PAGINATION_MAX_PAGE_SIZE),
+            ):
+                with self.subTest(paginator=paginator, limit=limit):
+                    request = Request(
+                        APIRequestFactory().get("/", {"limit": limit})
+                    )
+                    self.assertEqual(
+                        paginator.get_page_size(request), expected
+                    )
+
+
+class StreamedMetricsTest(TestCase):
+    """A streamed response is measured with the body it sends."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("user")
+        flour = Ingredient.objects.create(name="мука", measurement_unit="г")
+        recipe = create_recipe(cls.user, {flour: 10})
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        rebuild_cart_totals([cls.user])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_download_queries(self):
+        for file_format in ("txt", "pdf"):
+            with self.subTest(file_format), self.assertLogs(
+                "backend.metrics", "INFO"
+            ) as logs, CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    "/api/recipes/download_shopping_cart/",
+                    {"format": file_format},
+                )
+                self.assertEqual(logs.output, [])
+                b"".join(response.streaming_content)
+            self.assertNotIn("Server-Timing", response)
+            (line,) = logs.records
+            self.assertEqual(
+                json.loads(line.getMessage())["queries"], len(queries)
+            )
+
+    def test_closed_unread(self):
+        response = self.client.get("/api/recipes/download_shopping_cart/")
+        # As the test client does, not to close the test's connection.
+        request_finished.disconnect(close_old_connections)
+        try:
+            with self.assertLogs("backend.metrics", "INFO") as logs:
+                response.close()
+        finally:
+            request_finished.connect(close_old_connections)
+        self.assertEqual(len(logs.records), 1)
+
+
+class ServerTimingTest(TestCase):
+    """The timings are only sent when ``SERVER_TIMING`` is on."""
+
+    def test_header(self):
+        self.assertFalse(settings.SERVER_TIMING)
+        self.assertNotIn("Server-Timing", self.client.get("/api/tags/"))
+        with override_settings(SERVER_TIMING=True):
+            response = self.client.get("/api/tags/")
+        self.assertIn("total;dur=", response["Server-Timing"])
+
+
+class RecipeFilterTest(TestCase):
+    """Recipe filters compose into one query with no duplicates."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("user")
+        cls.author = create_user("author")
+        flour = Ingredient.objects.create(name="мука", measurement_unit="г")
+        cls.breakfast, cls.lunch = (
+            Tag.objects.create(name=slug, color=color, slug=slug)
+            for slug, color in (("breakfast", "#ff0000"), ("lunch", "#00ff00"))
+        )
+        cls.recipes = {}
+        for author in (cls.user, cls.author):
+            for tags in (
+                (cls.breakfast,),
+                (cls.lunch,),
+                (cls.breakfast, cls.lunch),
+            ):
+                recipe = create_recipe(author, {flour: 1})
+                recipe.tags.set(tags)
+                key = (author.username,) + tuple(tag.slug for tag in tags)
+                cls.recipes[key] = recipe.pk
+        for key in (("author", "breakfast"), ("author", "breakfast", "lunch")):
+            FavoriteRecipe.objects.create(
+                user=cls.user, recipe_id=cls.recipes[key]
+            )
+        for key in (("author", "breakfast", "lunch"), ("user", "lunch")):
+            ShoppingCart.objects.create(
+                user=cls.user, recipe_id=cls.recipes[key]
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, query):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f"/api/recipes/?limit=50&{query}")
+        self.assertEqual(response.status_code, 200)
+        ids = [recipe["id"] for recipe in response.data["results"]]
+        self.assertEqual(len(ids), response.data["count"])
+        return ids, context
+
+    def keys(self, ids):
+        names = {pk: key for key, pk in self.recipes.items()}
+        return {names[pk] for pk in ids}
+
+    def test_filters(self):
+        author = f"author={self.author.pk}"
+        cases = (
+            (
+                "tags=breakfast&tags=lunch",
+                set(self.recipes),
+            ),
+            (
+                f"tags=breakfast&{author}",
+                {("author", "breakfast"), ("author", "breakfast", "lunch")},
+            ),
+            (
+                "is_favorited=1&is_in_shopping_cart=1&tags=lunch",
+                {("author", "breakfast", "lunch")},
+            ),
+            (
+                f"is_favorited=0&is_in_shopping_cart=0&{author}",
+                {key for key in self.recipes if key[0] == "author"},
+            ),
+            (
+                "is_in_shopping_cart=1&tags=lunch",
+                {("author", "breakfast", "lunch"), ("user", "lunch")},
+            ),
+        )
+        _, unfiltered = self.get("")
+        for query, expected in cases:
+            with self.subTest(query):
+                ids, context = self.get(query)
+                self.assertEqual(len(ids), len(set(ids)))
+                self.assertEqual(self.keys(ids), expected)
+                for executed in context.captured_queries:
+                    self.assertNotIn("DISTINCT", executed["sql"])
+                # The tags and the author are looked up to be validated.
+                lookups = ("tags=" in query) + ("author=" in query)
+                self.assertEqual(len(context), len(unfiltered) + lookups)
+
+
+def make_photo(side):
+    """JPEG bytes of a noisy photo, hard to compress."""
+    buffer = io.BytesIO()
+    Image.effect_noise((side, side), 100).convert("RGB").save(
+        buffer, "JPEG", quality=95
+    )
+    return buffer.getvalue()
+
+
+class RecipeUploadTest(TestCase):
+    """Multipart photos are streamed to disk, not held in memory."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = tempfile.TemporaryDirectory()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media.name)
+        cls.media_settings.enable()
+        cls.photo = make_photo(1500)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_settings.disable()
+        cls.media.cleanup()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("user")
+        cls.tag = Tag.objects.create(name="Обед", color="#00ff00", slug="obed")
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("мука", "сахар")
+        ]
+
+    def form(self, photo):
+        data = {
+            "name": "Пирог",
+            "text": "Испечь.",
+            "cooking_time": 30,
+            "tags": [self.tag.pk],
+            "image": io.BytesIO(photo),
+        }
+        data["image"].name = "photo.jpg"
+        for number, ingredient in enumerate(self.ingredients):
+            data[f"ingredients[{number}]id"] = ingredient.pk
+            data[f"ingredients[{number}]amount"] = 10
+        return data
+
+    def create(self, data, format):
+        """The response and the peak memory of the view alone."""
+        request = APIRequestFactory().post(
+            "/api/recipes/", data, format=format
+        )
+        force_authenticate(request, self.user)
+        view = RecipeViewSet.as_view({"post": "create"})
+        tracemalloc.start()
+        try:
+            response = view(request)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            # The handler normally closes the uploaded temporary files.
+            request.close()
+        return response, peak
+
+    def test_multipart_memory(self):
+        response, peak = self.create(self.form(self.photo), "multipart")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertLess(peak, len(self.photo) / 4, (peak, len(self.photo)))
+
+    def test_base64_still_accepted(self):
+        data = self.form(self.photo)
+        del data["image"]
+        data["image"] = "data:image/jpeg;base64," + base64.b64encode(
+            self.photo
+        ).decode()
+        data["ingredients"] = [
+            {"id": ingredient.pk, "amount": 10}
+            for ingredient in self.ingredients
+        ]
+        data = {
+            key: value
+            for key, value in data.items()
+            if not key.startswith("ingredients[")
+        }
+        response, peak = self.create(data, "json")
+        self.assertEqual(response.status_code, 201, response.data)
+        # Decoded, the photo is held in memory several times.
+        self.assertGreater(peak, len(self.photo))
+
+    def test_limits(self):
+        for limits in (
+            {"RECIPE_IMAGE_MAX_SIZE": len(self.photo) // 2},
+            {"RECIPE_IMAGE_MAX_SIDE": 1000},
+        ):
+            with self.subTest(limits), override_settings(**limits):
+                response, _ = self.create(self.form(self.photo), "multipart")
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("image", response.data)
@@ -1,4 +1,6 @@
-from django.db.models import Sum
+from django.conf import settings
+from django.db import transaction
+from django.utils.cache import get_conditional_response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
@@ -7,23 +9,38 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 
+from backend.pagination import RecipePagination
+from recipes.cache import cache_response
+from recipes.images import RecipeImageUploadHandler
 from recipes.permissions import IsAdminAuthorOrReadOnly, IsAdminOrReadOnly
-from recipes.serializers import AddRecipeSerializer, ShowRecipeSerializer
-from recipes.services import convert_to_file
-
-from .filters import IngredientSearchFilter, RecipeFilter
-from .models import (
-    FavoriteRecipe,
-    Ingredient,
-    Recipe,
-    RecipeIngredient,
-    ShoppingCart,
+from recipes.search import get_ingredient_index
+from recipes.serializers import (
+    FAVORITE_EXISTS_MESSAGE,
+    SHOPPING_CART_EXISTS_MESSAGE,
+    AddRecipeSerializer,
+    RecipeIdsSerializer,
+    ShortRecipeSerializer,
+    ShowRecipeSerializer,
 )
-from .serializers import (
-    FavoriteRecipeSerializer,
-    IngredientSerializer,
-    ShoppingCartSerializer,
+from recipes.services import (
+    EXPORTERS,
+    ShoppingCartNegotiation,
+    add_to_cart_totals,
+    change_counter,
+    convert_to_file,
+    get_cart_etag,
+    get_cart_ingredients,
+    insert_ignoring_conflicts,
+    lock_cart_totals,
+    rebuild_cart_totals,
+    remove_from_cart_totals,
+    set_counter,
 )
+from users.models import User
+
+from .filters import IngredientSearchFilter, RecipeFilter
+from .models import FavoriteRecipe, Ingredient, Recipe, ShoppingCart
+from .serializers import IngredientSerializer
 
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
@@ -36,6 +53,23 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientSearchFilter
 
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == "list" and self.request.query_params.get("name"):
+            return queryset[: settings.INGREDIENT_SEARCH_LIMIT]
+        return queryset
+
+    @cache_response("ingredients")
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get("name")
+        if name and settings.INGREDIENT_SEARCH_INDEX:
+            return Response(
+                get_ingredient_index().search(
+                    name, settings.INGREDIENT_SEARCH_LIMIT
+                )
+            )
+        return super().list(request, *args, **kwargs)
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """A viewset for processing recipes."""
@@ -50,25 +84,123 @@ class RecipeViewSet(viewsets.ModelViewSet):
         "list": ShowRecipeSerializer,
     }
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
+
+    def initialize_request(self, request, *args, **kwargs):
+        """Stream multipart photos to temporary files with size checks.
+
+        Recipes are accepted both as JSON with a base64 photo and as
+        multipart/form-data: ``tags`` repeated, ``ingredients[0]id`` and
+        ``ingredients[0]amount`` for every ingredient, the photo as a file.
+        """
+        request.upload_handlers = [RecipeImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.serializer_classes:
+            return queryset.with_user_flags(self.request.user)
+        return queryset
 
     def get_serializer_class(self):
         return self.serializer_classes.get(
             self.action, self.default_serializer_class
         )
 
-    def __add_or_del_recipe(self, method, user, pk, model, serializer):
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # Locked first, as by the cart requests: none can put the
+            # recipe into a cart any more, the carts read are all of them.
+            list(
+                Recipe.objects.select_for_update()
+                .filter(pk=instance.pk)
+                .values_list("pk")
+            )
+            cart_users = list(
+                User.objects.filter(shopping_cart__recipe=instance)
+            )
+            instance.delete()
+            rebuild_cart_totals(cart_users)
+            change_counter(
+                User.objects.filter(pk=instance.author_id), "recipes_count", -1
+            )
+
+    def __add_or_del_recipe(self, request, pk, model, counter, exists_message):
         """Add/remove to favorites or shopping cart."""
-        recipe = get_object_or_404(Recipe, pk=pk)
-        if method == "POST":
-            model.objects.get_or_create(user=user, recipe=recipe)
-            return Response(
-                serializer.to_representation(instance=recipe),
-                status=status.HTTP_201_CREATED,
+        method, user = request.method, request.user
+        if method not in ("POST", "DELETE"):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            # The recipe, then the user, as in perform_destroy(). The totals
+            # are changed with the cart, so requests for the same recipe
+            # and user are applied one after another.
+            recipe = get_object_or_404(
+                Recipe.objects.select_for_update(), pk=pk
             )
-        if method == "DELETE":
-            model.objects.filter(user=user, recipe=recipe).delete()
+            counted = Recipe.objects.filter(pk=recipe.pk)
+            if model is ShoppingCart:
+                lock_cart_totals([user])
+            if method == "POST":
+                created = insert_ignoring_conflicts(
+                    model, user_id=user.pk, recipe_id=recipe.pk
+                )
+                if not created:
+                    return Response(
+                        {"errors": exists_message},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                change_counter(counted, counter, 1)
+                if model is ShoppingCart:
+                    add_to_cart_totals(user, recipe)
+                return Response(
+                    ShortRecipeSerializer(
+                        recipe, context={"request": request}
+                    ).data,
+                    status=status.HTTP_201_CREATED,
+                )
+            deleted, _ = model.objects.filter(
+                user=user, recipe=recipe
+            ).delete()
+            if deleted:
+                change_counter(counted, counter, -1)
+                if model is ShoppingCart:
+                    remove_from_cart_totals(user, recipe)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def __bulk_add_or_del_recipes(self, request, model, counter):
+        """Add/remove a list of recipes to favorites or shopping cart."""
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.validated_data["recipes"]
+        user = request.user
+        user_recipes = model.objects.filter(user=user, recipe__in=recipes)
+        with transaction.atomic():
+            present = set(user_recipes.values_list("recipe_id", flat=True))
+            if request.method == "POST":
+                changed = len(present) < len(recipes)
+                model.objects.bulk_create(
+                    [model(user=user, recipe=recipe) for recipe in recipes],
+                    ignore_conflicts=True,
+                )
+            else:
+                changed = bool(present)
+                user_recipes.delete()
+            # Concurrent requests may insert or delete the same rows, so
+            # the counters are recounted rather than moved by the rows
+            # this request expected to change.
+            pks = [recipe.pk for recipe in recipes]
+            set_counter(Recipe.objects.filter(pk__in=pks), counter)
+            # After the recipes, locked by set_counter().
+            if changed and model is ShoppingCart:
+                rebuild_cart_totals([user])
+        if request.method == "DELETE":
             return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            ShortRecipeSerializer(
+                recipes, many=True, context={"request": request}
+            ).data,
+            status=status.HTTP_201_CREATED,
+        )
 
     @action(
         detail=True,
@@ -80,11 +212,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def favorite(self, request, pk):
         """Adding to favorites, deleting from favorites."""
         return self.__add_or_del_recipe(
-            request.method,
-            request.user,
+            request,
             pk,
             model=FavoriteRecipe,
-            serializer=FavoriteRecipeSerializer(),
+            counter="favorites_count",
+            exists_message=FAVORITE_EXISTS_MESSAGE,
         )
 
     @action(
@@ -97,11 +229,37 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def shopping_cart(self, request, pk):
         """Adding purchases to the shopping cart, removing purchases from the shopping cart."""
         return self.__add_or_del_recipe(
-            request.method,
-            request.user,
+            request,
             pk,
             model=ShoppingCart,
-            serializer=ShoppingCartSerializer(),
+            counter="in_carts_count",
+            exists_message=SHOPPING_CART_EXISTS_MESSAGE,
+        )
+
+    @action(
+        detail=False,
+        methods=["POST", "DELETE"],
+        url_path="favorite",
+        url_name="bulk_favorite",
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def bulk_favorite(self, request):
+        """Adding a list of recipes to favorites, deleting them from it."""
+        return self.__bulk_add_or_del_recipes(
+            request, model=FavoriteRecipe, counter="favorites_count"
+        )
+
+    @action(
+        detail=False,
+        methods=["POST", "DELETE"],
+        url_path="shopping_cart",
+        url_name="bulk_shopping_cart",
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def bulk_shopping_cart(self, request):
+        """Adding a list of recipes to the shopping cart, removing them."""
+        return self.__bulk_add_or_del_recipes(
+            request, model=ShoppingCart, counter="in_carts_count"
         )
 
     @action(
@@ -114,17 +272,19 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[
             IsAuthenticated,
         ],
+        content_negotiation_class=ShoppingCartNegotiation,
     )
     def download_shopping_cart(self, request):
         """Uploading the shopping cart."""
-        cart_ingredients = (
-            RecipeIngredient.objects.filter(
-                recipe__shopping_cart__user=request.user
-            )
-            .values(
-                "ingredient__name",
-                "ingredient__measurement_unit",
+        file_format = request.query_params.get("format", "txt")
+        if file_format not in EXPORTERS:
+            return Response(
+                {"errors": f"Формат {file_format} не поддерживается"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            .annotate(ingredient_total_amount=Sum("amount"))
-        )
-        return convert_to_file(cart_ingredients)
+        etag = get_cart_etag(request.user, file_format)
+        not_modified = get_conditional_response(request, etag=f'"{etag}"')
+        if not_modified is not None:
+            return not_modified
+        cart_ingredients = get_cart_ingredients(request.user)
+        return convert_to_file(cart_ingredients, file_format, etag)
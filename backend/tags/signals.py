@@ -0,0 +1,14 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.cache import bump_cache_version
+
+from .models import Tag
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    """Drop the cached tags after any change."""
+    transaction.on_commit(lambda: bump_cache_version("tags"))
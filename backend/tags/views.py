@@ -1,5 +1,6 @@
 from rest_framework import viewsets
 
+from recipes.cache import cache_response
 from recipes.permissions import IsAdminOrReadOnly
 from tags.serializers import TagSerializer
 
@@ -11,3 +12,7 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = (IsAdminOrReadOnly,)
+
+    @cache_response("tags")
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
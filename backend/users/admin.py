@@ -12,6 +12,8 @@ class UserAdmin(admin.ModelAdmin):
         "last_name",
         "email",
         "role",
+        "recipes_count",
+        "followers_count",
     )
     list_filter = ("email", "username")
     search_fields = (
@@ -50,6 +50,12 @@ class User(AbstractUser):
         choices=ROLES,
         default=USER,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name="Количество рецептов", default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name="Количество подписчиков", default=0, editable=False
+    )
 
     REQUIRED_FIELDS = [
         "email",
@@ -3,6 +3,7 @@ from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 
+from recipes.images import RecipeImageField
 from recipes.models import Recipe
 from users.models import Follow, User
 
@@ -55,6 +56,8 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         request = self.context.get("request")
         if request is None or request.user.is_anonymous:
             return False
@@ -64,6 +67,8 @@ class CustomUserSerializer(UserSerializer):
 class FollowShortRecipeSerializer(serializers.ModelSerializer):
     """Serializer for displaying recipes in a subscription."""
 
+    image = RecipeImageField("thumbnail")
+
     class Meta:
         model = Recipe
         fields = ("id", "name", "image", "cooking_time")
@@ -73,7 +78,6 @@ class ShowFollowsSerializer(CustomUserSerializer):
     """Serializer for displaying subs."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -89,13 +93,10 @@ class ShowFollowsSerializer(CustomUserSerializer):
         )
 
     def get_recipes(self, obj):
-        recipes = obj.recipes.all()[:RECIPES_LIMIT]
+        recipes_limit = self.context.get("recipes_limit", RECIPES_LIMIT)
+        recipes = obj.recipes.all()[:recipes_limit]
         return FollowShortRecipeSerializer(recipes, many=True).data
 
-    def get_recipes_count(self, obj):
-        recipes = Recipe.objects.filter(author=obj)
-        return recipes.count()
-
 
 class FollowSerializer(serializers.ModelSerializer):
     """Subscription serializer."""
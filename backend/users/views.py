@@ -1,13 +1,19 @@
+from django.db import transaction
+from django.db.models import BooleanField, Exists, OuterRef, Prefetch, Value
+from django.http import Http404
 from djoser.views import UserViewSet
 from rest_framework import permissions, status
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 
+from backend.pagination import LimitPageNumberPaginator
+from recipes.models import Recipe
+from recipes.services import change_counter
 from users.models import Follow, User
 from users.serializers import (
+    RECIPES_LIMIT,
     CustomUserSerializer,
     FollowSerializer,
     ShowFollowsSerializer,
@@ -22,6 +28,24 @@ class CustomUserViewSet(UserViewSet):
     permission_classes = [
         IsAuthenticatedOrReadOnly,
     ]
+    pagination_class = LimitPageNumberPaginator
+
+    def get_queryset(self):
+        """Users with the subscription flag of the current user."""
+        queryset = super().get_queryset()
+        if self.action not in ("list", "retrieve"):
+            return queryset
+        if self.request.user.is_anonymous:
+            return queryset.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return queryset.annotate(
+            is_subscribed=Exists(
+                Follow.objects.filter(
+                    user=self.request.user, author=OuterRef("pk")
+                )
+            )
+        )
 
     @action(
         detail=True,
@@ -36,15 +60,32 @@ class CustomUserViewSet(UserViewSet):
         serializer = FollowSerializer(
             data={"user": request.user.id, "author": id}
         )
+        followers = User.objects.filter(pk=author.pk)
         if request.method == "POST":
             serializer.is_valid(raise_exception=True)
-            serializer.save(user=request.user)
-            serializer = ShowFollowsSerializer(author)
+            with transaction.atomic():
+                serializer.save(user=request.user)
+                change_counter(followers, "followers_count", 1)
+            author.refresh_from_db(fields=["followers_count"])
+            serializer = ShowFollowsSerializer(
+                author,
+                context={
+                    "request": request,
+                    "recipes_limit": self.get_recipes_limit(request),
+                },
+            )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        follow = get_object_or_404(Follow, user=request.user, author__id=id)
-        follow.delete()
+        with transaction.atomic():
+            # Only the request that deleted the follow changes the counter.
+            deleted, _ = Follow.objects.filter(
+                user=request.user, author=author
+            ).delete()
+            if deleted:
+                change_counter(followers, "followers_count", -1)
+        if not deleted:
+            raise Http404
         return Response(
-            f"{request.user} отписался от {follow.author}",
+            f"{request.user} отписался от {author}",
             status=status.HTTP_204_NO_CONTENT,
         )
 
@@ -57,10 +98,39 @@ class CustomUserViewSet(UserViewSet):
     )
     def show_follows(self, request):
         """Viewing subscriptions."""
-        user_obj = User.objects.filter(following__user=request.user)
-        paginator = PageNumberPagination()
+        recipes_limit = self.get_recipes_limit(request)
+        user_obj = self.get_follows_queryset(request.user, recipes_limit)
+        paginator = LimitPageNumberPaginator()
         result_page = paginator.paginate_queryset(user_obj, request)
         serializer = ShowFollowsSerializer(
-            result_page, many=True, context={"current_user": request.user}
+            result_page,
+            many=True,
+            context={"request": request, "recipes_limit": recipes_limit},
         )
         return paginator.get_paginated_response(serializer.data)
+
+    @staticmethod
+    def get_recipes_limit(request):
+        """The number of recipes to show for each author."""
+        recipes_limit = request.query_params.get("recipes_limit")
+        if recipes_limit is None or not recipes_limit.isdigit():
+            return RECIPES_LIMIT
+        return int(recipes_limit)
+
+    @staticmethod
+    def get_follows_queryset(user, recipes_limit):
+        """Followed authors with their latest recipes.
+
+        The latest recipes of every author on the page are fetched with a
+        single prefetch query limited by a correlated subquery.
+        """
+        latest_recipes = Recipe.objects.filter(
+            pk__in=Recipe.objects.filter(author=OuterRef("author")).values(
+                "pk"
+            )[:recipes_limit]
+        )
+        return (
+            User.objects.filter(following__user=user)
+            .annotate(is_subscribed=Value(True, output_field=BooleanField()))
+            .prefetch_related(Prefetch("recipes", queryset=latest_recipes))
+        )